@@ -1,35 +1,149 @@
-import os
-from flask import Flask, jsonify
-from flask_cors import CORS
-from flask_sqlalchemy import SQLAlchemy
-
-db = SQLAlchemy()
-
-def create_app():
-    app = Flask(__name__)
-
-    database_url = os.getenv("DATABASE_URL", "sqlite:///local.db")
-    jwt_secret = os.getenv("JWT_SECRET", "dev_secret_change_me")
-
-    app.config["SQLALCHEMY_DATABASE_URI"] = database_url
-    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-    app.config["JWT_SECRET"] = jwt_secret
-
-    cors_origins = os.getenv("CORS_ORIGINS", "*")
-    # CORS_ORIGINS può essere "*" oppure lista separata da virgole
-    if cors_origins.strip() == "*":
-        CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
-    else:
-        origins = [o.strip() for o in cors_origins.split(",") if o.strip()]
-        CORS(app, resources={r"/api/*": {"origins": origins}}, supports_credentials=True)
-
-    db.init_app(app)
-
-    from app.routes import bp as api_bp
-    app.register_blueprint(api_bp, url_prefix="/api")
-
-    @app.get("/api/health")
-    def health():
-        return jsonify({"ok": True})
-
-    return app
+import os
+from flask import Flask, jsonify
+from flask_cors import CORS
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import configure_mappers
+
+db = SQLAlchemy()
+
+def create_app():
+    app = Flask(__name__)
+
+    database_url = os.getenv("DATABASE_URL", "sqlite:///local.db")
+    jwt_secret = os.getenv("JWT_SECRET", "dev_secret_change_me")
+
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_url
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["JWT_SECRET"] = jwt_secret
+    app.config["AVAILABILITY_CACHE_SIZE"] = int(os.getenv("AVAILABILITY_CACHE_SIZE", "256"))
+    app.config["AVAILABILITY_CACHE_TTL"] = float(os.getenv("AVAILABILITY_CACHE_TTL", "30"))
+    app.config["USER_CACHE_SIZE"] = int(os.getenv("USER_CACHE_SIZE", "1024"))
+    app.config["USER_CACHE_TTL"] = float(os.getenv("USER_CACHE_TTL", "30"))
+    app.config["AUTH_TRUST_CLAIMS"] = os.getenv("AUTH_TRUST_CLAIMS", "0") == "1"
+    app.config["PASSWORD_METHOD"] = os.getenv("PASSWORD_METHOD", "scrypt")
+    app.config["PASSWORD_POOL"] = os.getenv("PASSWORD_POOL", "thread")
+    app.config["PASSWORD_WORKERS"] = int(os.getenv("PASSWORD_WORKERS", "4"))
+    app.config["PASSWORD_QUEUE"] = int(os.getenv("PASSWORD_QUEUE", "32"))
+    app.config["PASSWORD_TIMEOUT"] = float(os.getenv("PASSWORD_TIMEOUT", "10"))
+    app.config["REPORTS_DIR"] = os.getenv("REPORTS_DIR", os.path.join(app.instance_path, "reports"))
+    app.config["REPORT_WORKERS"] = int(os.getenv("REPORT_WORKERS", "1"))
+    app.config["SSE_MAX_STREAMS"] = int(os.getenv("SSE_MAX_STREAMS", "50"))
+    app.config["SSE_BUFFER_SIZE"] = int(os.getenv("SSE_BUFFER_SIZE", "1024"))
+    app.config["SSE_HEARTBEAT"] = float(os.getenv("SSE_HEARTBEAT", "15"))
+    app.config["SSE_SPARE_THREADS"] = int(os.getenv("SSE_SPARE_THREADS", "4"))
+    app.config["SCHEDULE_TTL"] = float(os.getenv("SCHEDULE_TTL", "60"))
+    app.config["ADMISSION_MODE"] = os.getenv("ADMISSION_MODE", "off")
+    app.config["ADMISSION_BATCH"] = int(os.getenv("ADMISSION_BATCH", "32"))
+    app.config["ADMISSION_MAX_PENDING"] = int(os.getenv("ADMISSION_MAX_PENDING", "1000"))
+    app.config["ADMISSION_WAIT"] = float(os.getenv("ADMISSION_WAIT", "5"))
+    app.config["ADMISSION_TICKET_TTL"] = float(os.getenv("ADMISSION_TICKET_TTL", "60"))
+    app.config["ARCHIVE_AFTER_DAYS"] = int(os.getenv("ARCHIVE_AFTER_DAYS", "60"))
+    app.config["ARCHIVE_BATCH_SIZE"] = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+    app.config["ARCHIVE_INTERVAL_HOURS"] = float(os.getenv("ARCHIVE_INTERVAL_HOURS", "0"))
+    app.config["RATE_LIMIT_ENABLED"] = os.getenv("RATE_LIMIT_ENABLED", "0") == "1"
+    app.config["RATE_LIMIT_READ"] = os.getenv("RATE_LIMIT_READ", "10:40")
+    app.config["RATE_LIMIT_WRITE"] = os.getenv("RATE_LIMIT_WRITE", "2:10")
+    app.config["RATE_LIMIT_LOGIN"] = os.getenv("RATE_LIMIT_LOGIN", "0.2:10")
+    app.config["RATE_LIMIT_KEYS"] = int(os.getenv("RATE_LIMIT_KEYS", "10000"))
+    app.config["RATE_LIMIT_PROXIES"] = int(os.getenv("RATE_LIMIT_PROXIES", "0"))
+    app.config["BUS_TRANSPORT"] = os.getenv("BUS_TRANSPORT", "off")
+    app.config["BUS_POLL_INTERVAL"] = float(os.getenv("BUS_POLL_INTERVAL", "0.025"))
+    app.config["BUS_RETENTION"] = float(os.getenv("BUS_RETENTION", "600"))
+    app.config["METRICS_ENABLED"] = os.getenv("METRICS_ENABLED", "1") == "1"
+    app.config["METRICS_SERVER_TIMING"] = os.getenv("METRICS_SERVER_TIMING", "0") == "1"
+    app.config["SLOW_QUERY_MS"] = float(os.getenv("SLOW_QUERY_MS", "500"))
+
+    cors_origins = os.getenv("CORS_ORIGINS", "*")
+    # CORS_ORIGINS può essere "*" oppure lista separata da virgole
+    if cors_origins.strip() == "*":
+        CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
+    else:
+        origins = [o.strip() for o in cors_origins.split(",") if o.strip()]
+        CORS(app, resources={r"/api/*": {"origins": origins}}, supports_credentials=True)
+
+    # pragma SQLite / pool PostgreSQL secondo DB_PROFILE (app.db_profiles)
+    from app import db_profiles
+    profile, db_settings = db_profiles.resolve(os.getenv("DB_PROFILE", "auto"), database_url)
+    app.config["DB_PROFILE"] = profile
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = db_profiles.engine_options(database_url, db_settings)
+
+    db.init_app(app)
+    db_profiles.init_app(app, db_settings)
+
+    from app.availability import availability_cache
+    availability_cache.init_app(app)
+
+    from app.auth import user_cache
+    user_cache.init_app(app)
+
+    from app.security import password_hasher
+    password_hasher.init_app(app)
+
+    from app.schedule import schedule
+    schedule.init_app(app)
+
+    from app.events import publisher
+    publisher.init_app(app)
+
+    from app.metrics import metrics
+    metrics.init_app(app)
+
+    from app.admission import admission_queue
+    admission_queue.init_app(app)
+    if admission_queue.enabled:
+        metrics.add_collector(admission_queue.metrics_lines)
+
+    from app.ratelimit import rate_limiter
+    rate_limiter.init_app(app)
+    if rate_limiter.enabled:
+        metrics.add_collector(rate_limiter.metrics_lines)
+
+    from app.bus import bus
+    bus.init_app(app)
+    if bus.enabled:
+        metrics.add_collector(bus.metrics_lines)
+
+    from app.routes import bp as api_bp
+    app.register_blueprint(api_bp, url_prefix="/api")
+
+    @app.get("/api/health")
+    def health():
+        return jsonify({"ok": True})
+
+    # thread di servizio (archiviazione, bus di invalidazione) alla prima
+    # richiesta, nel processo che serve: con gunicorn --preload create_app gira
+    # nel master e i thread non passano il fork
+    from app import archive
+
+    @app.before_request
+    def start_background():
+        archive.start_scheduler(app)
+        bus.start()
+
+    # mapper ORM configurati subito: con --preload una volta sola nel master
+    # (memoria condivisa dai worker) invece che alla prima query di ogni worker
+    configure_mappers()
+
+    return app
+
+
+def after_fork(app):
+    # worker appena creato da un master che ha già caricato l'app (gunicorn.conf.py):
+    # le connessioni ereditate restano al master, il worker ne apre di sue.
+    # app può essere anche l'AsyncApi di asgi.py.
+    from app.availability import availability_cache
+    from app.bus import bus
+    from app.events import publisher
+
+    engines = []
+    if hasattr(app, "flask_app"):
+        engines.append(app.engine.sync_engine)
+        app = app.flask_app
+    with app.app_context():
+        engines.append(db.engine)
+    for engine in engines:
+        engine.dispose(close=False)
+
+    availability_cache.after_fork()
+    publisher.after_fork()
+    bus.after_fork()
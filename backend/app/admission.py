@@ -0,0 +1,191 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from app import db
+from app import booking
+
+# Coda di ammissione per le prenotazioni (ADMISSION_MODE=queue).
+# All'apertura di uno slot richiesto (es. PISCINA, 14 posti) centinaia di
+# richieste arrivano insieme: invece di far litigare i thread per il lock di
+# scrittura, ogni richiesta diventa un ticket in una FIFO per (slot, data) e un
+# solo thread committer le applica a lotti in un'unica transazione (group
+# commit). Dentro una chiave l'ordine è d'arrivo; tra chiavi diverse il
+# committer prende un ticket per chiave a giro, così uno slot caldo non
+# blocca gli altri. La coda è per-worker: con N worker ci sono N committer.
+
+
+class AdmissionFull(Exception):
+    pass
+
+
+class Ticket:
+    __slots__ = ("id", "user_id", "slot", "d", "created", "done", "finished", "error", "status", "prenotati")
+
+    def __init__(self, user_id, slot, d):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.slot = slot
+        self.d = d
+        self.created = time.monotonic()
+        self.done = threading.Event()
+        self.finished = None
+        self.error = None
+        self.status = None
+        self.prenotati = None
+
+    def fail(self, message, status):
+        self.error = message
+        self.status = status
+
+
+class AdmissionQueue:
+    def __init__(self, batch_size=32, max_pending=1000, wait=5.0, ticket_ttl=60.0):
+        self.enabled = False
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.wait = wait
+        self.ticket_ttl = ticket_ttl
+        self._queues = OrderedDict()  # (slot_id, data) -> deque di Ticket
+        self._tickets = {}  # id -> Ticket (in coda o completati da meno di ticket_ttl)
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._app = None
+        self._thread = None
+        self._batches = 0
+        self._processed = 0
+
+    def init_app(self, app):
+        self.enabled = app.config.get("ADMISSION_MODE", "off") == "queue"
+        self.batch_size = int(app.config.get("ADMISSION_BATCH", self.batch_size))
+        self.max_pending = int(app.config.get("ADMISSION_MAX_PENDING", self.max_pending))
+        self.wait = float(app.config.get("ADMISSION_WAIT", self.wait))
+        self.ticket_ttl = float(app.config.get("ADMISSION_TICKET_TTL", self.ticket_ttl))
+        self._app = app
+
+    def submit(self, user_id, slot, d):
+        ticket = Ticket(user_id, slot, d)
+        with self._cond:
+            if self._pending >= self.max_pending:
+                raise AdmissionFull()
+            # il thread parte alla prima richiesta (dopo il fork dei worker)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="admission-committer", daemon=True)
+                self._thread.start()
+            self._queues.setdefault((slot.id, d), deque()).append(ticket)
+            self._tickets[ticket.id] = ticket
+            self._pending += 1
+            self._cond.notify()
+        return ticket
+
+    def get(self, ticket_id, user_id):
+        ticket = self._tickets.get(ticket_id)
+        if ticket is None or ticket.user_id != user_id:
+            return None
+        return ticket
+
+    def position(self, ticket):
+        # 1 = il prossimo per il suo (slot, data); 0 = già elaborato
+        with self._cond:
+            q = self._queues.get((ticket.slot.id, ticket.d))
+            if not q or ticket.done.is_set():
+                return 0
+            for i, t in enumerate(q, 1):
+                if t is ticket:
+                    return i
+            return 0
+
+    def metrics_lines(self):
+        with self._cond:
+            pending, keys = self._pending, len(self._queues)
+        return [
+            "# TYPE sport_admission_pending gauge",
+            f"sport_admission_pending {pending}",
+            "# TYPE sport_admission_hot_keys gauge",
+            f"sport_admission_hot_keys {keys}",
+            "# TYPE sport_admission_batches_total counter",
+            f"sport_admission_batches_total {self._batches}",
+            "# TYPE sport_admission_tickets_total counter",
+            f"sport_admission_tickets_total {self._processed}",
+        ]
+
+    def _take_batch(self):
+        # un ticket per chiave a giro, fino a batch_size
+        batch = []
+        while self._queues and len(batch) < self.batch_size:
+            key, q = next(iter(self._queues.items()))
+            batch.append(q.popleft())
+            if q:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+        self._pending -= len(batch)
+        return batch
+
+    def _expire(self):
+        now = time.monotonic()
+        for ticket_id in [i for i, t in self._tickets.items() if t.finished and now - t.finished > self.ticket_ttl]:
+            del self._tickets[ticket_id]
+
+    def _run(self):
+        with self._app.app_context():
+            while True:
+                with self._cond:
+                    while not self._queues:
+                        self._expire()
+                        self._cond.wait(self.ticket_ttl)
+                    batch = self._take_batch()
+                try:
+                    self._commit(batch)
+                finally:
+                    db.session.remove()
+                    now = time.monotonic()
+                    for t in batch:
+                        if t.status is None:
+                            t.fail("Booking failed", 500)
+                        t.finished = now
+                        t.done.set()
+
+    def _commit(self, batch):
+        # evita l'import circolare: booking_changed aggiorna cache e stream SSE
+        from app.routes import booking_changed
+
+        def apply(t, full):
+            key = (t.slot.id, t.d)
+            if key in full:
+                t.fail("Full", 409)
+                return
+            try:
+                _, t.prenotati = booking.reserve(t.user_id, t.slot, t.d)
+                t.status = 200
+            except booking.BookingError as e:
+                t.fail(e.message, e.status)
+                if e.message == "Full":
+                    full.add(key)
+
+        try:
+            full = set()
+            for t in batch:
+                apply(t, full)
+            db.session.commit()
+        except Exception:
+            # errore del DB a metà lotto: si riprova un ticket per transazione
+            db.session.rollback()
+            for t in batch:
+                t.status = t.error = t.prenotati = None
+                try:
+                    apply(t, set())
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    t.fail("Booking failed", 500)
+
+        self._batches += 1
+        self._processed += len(batch)
+        for t in batch:
+            if t.status == 200:
+                booking_changed(t.d, t.slot.id, t.prenotati, +1, t.slot.capienza)
+
+
+admission_queue = AdmissionQueue()
@@ -1,34 +0,0 @@
-from __future__ import annotations
-
-import os
-from datetime import timedelta
-from flask import Flask
-from flask_cors import CORS
-from flask_jwt_extended import JWTManager
-from flask_sqlalchemy import SQLAlchemy
-
-db = SQLAlchemy()
-jwt = JWTManager()
-
-def create_app() -> Flask:
-    app = Flask(__name__)
-    app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "dev-secret")
-    app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL", "sqlite:///sport_izar.db")
-    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-    app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY", "dev-jwt-secret")
-    app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=12)
-
-    cors_origins = os.getenv("CORS_ORIGINS", "http://localhost:5173").split(",")
-    CORS(app, resources={r"/api/*": {"origins": [o.strip() for o in cors_origins if o.strip()]}})
-
-    db.init_app(app)
-    jwt.init_app(app)
-
-    from .routes import api_bp
-    app.register_blueprint(api_bp, url_prefix="/api")
-
-    @app.get("/health")
-    def health():
-        return {"ok": True}
-
-    return app
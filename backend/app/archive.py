@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import delete, func, select, union_all
+
+from app import db
+from app.booking import _insert
+from app.models import Prenotazione, PrenotazioneArchivio
+
+# Partizionamento caldo/freddo: le prenotazioni più vecchie di
+# ARCHIVE_AFTER_DAYS passano a prenotazioni_archive a blocchi (INSERT + DELETE
+# per blocco, una transazione ciascuno), così la tabella prenotazioni e i suoi
+# indici contengono solo il periodo in corso. I contatori slot_occupancy
+# restano: le statistiche non cambiano.
+
+log = logging.getLogger(__name__)
+
+_COLUMNS = ("id", "user_id", "slot_id", "data", "timestamp_creazione", "serie_id")
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def archived_until():
+    # ultima data presente in archivio (None = archivio vuoto)
+    return db.session.query(func.max(PrenotazioneArchivio.data)).scalar()
+
+
+def bookings_source(d_from=None, d_to=None, user_id=None):
+    # tabella da cui leggere le prenotazioni del periodo: prenotazioni, oppure
+    # prenotazioni UNION ALL archivio se il periodo arriva alle date archiviate.
+    # Espone le colonne di Prenotazione (.c.id, .c.slot_id, .c.data, ...);
+    # chi la usa filtra comunque su .c.data.
+    live = Prenotazione.__table__
+    last = archived_until()
+    if last is None or (d_from is not None and d_from > last):
+        return live
+
+    def branch(table):
+        q = select(*(table.c[name] for name in _COLUMNS))
+        if d_from is not None:
+            q = q.where(table.c.data >= d_from)
+        if d_to is not None:
+            q = q.where(table.c.data <= d_to)
+        if user_id is not None:
+            q = q.where(table.c.user_id == user_id)
+        return q
+
+    return union_all(branch(live), branch(PrenotazioneArchivio.__table__)).subquery("prenotazioni_all")
+
+
+def archive_before(cutoff, batch_size=1000):
+    # sposta le prenotazioni con data < cutoff; ritorna quante
+    live = Prenotazione.__table__
+    archive = PrenotazioneArchivio.__table__
+    moved = 0
+    while True:
+        ids = db.session.execute(
+            select(live.c.id).where(live.c.data < cutoff).order_by(live.c.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        # ON CONFLICT DO NOTHING: rilanciabile dopo un'interruzione (o da due worker insieme)
+        db.session.execute(
+            _insert(archive)
+            .from_select(list(_COLUMNS), select(*(live.c[name] for name in _COLUMNS)).where(live.c.id.in_(ids)))
+            .on_conflict_do_nothing()
+        )
+        db.session.execute(delete(live).where(live.c.id.in_(ids)))
+        db.session.commit()
+        moved += len(ids)
+    return moved
+
+
+def cutoff_for(app, today=None):
+    return (today or date.today()) - timedelta(days=app.config["ARCHIVE_AFTER_DAYS"])
+
+
+def start_scheduler(app):
+    # archiviazione periodica in un thread del worker (ARCHIVE_INTERVAL_HOURS > 0)
+    # (chiamata a ogni richiesta da create_app: il thread parte alla prima)
+    global _scheduler
+    interval = app.config.get("ARCHIVE_INTERVAL_HOURS", 0) * 3600
+    if interval <= 0 or _scheduler is not None:
+        return
+
+    def run():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    moved = archive_before(cutoff_for(app), app.config["ARCHIVE_BATCH_SIZE"])
+                    if moved:
+                        log.info("archiviate %d prenotazioni", moved)
+                except Exception:
+                    db.session.rollback()
+                    log.exception("archiviazione fallita")
+                finally:
+                    db.session.remove()
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(target=run, name="bookings-archiver", daemon=True)
+            _scheduler.start()
@@ -0,0 +1,282 @@
+import asyncio
+import json
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import create_app, db_profiles
+from app.auth import AuthUser, read_token, user_cache
+from app.availability import availability_cache
+from app.bus import bus
+from app.events import publisher
+from app.models import User, Prenotazione
+from app.ratelimit import rate_limiter
+from app.routes import slot_availability, slots_etag
+from app.schedule import schedule
+
+# Modalità ASGI (backend/asgi.py): le letture più frequenti (GET /api/slots,
+# /api/me, /api/health) sono servite da un event loop con sessioni SQLAlchemy
+# async, quindi una richiesta in attesa del DB non occupa un thread. Tutto il
+# resto (scritture, admin, SSE, OPTIONS/CORS) passa all'app Flask tramite
+# asgiref. Cache disponibilità, cache utenti e orario sono gli stessi oggetti
+# dell'app Flask nello stesso processo: le prenotazioni li aggiornano come prima.
+# Le richieste servite qui non compaiono in /api/metrics.
+#
+# WsgiToAsgi di default esegue tutte le richieste WSGI in un solo thread
+# condiviso (thread_sensitive): uno stream SSE aperto bloccherebbe login e
+# prenotazioni. Qui girano in un pool di ASGI_WSGI_THREADS thread e gli stream
+# SSE sono limitati a ASGI_WSGI_THREADS - SSE_SPARE_THREADS.
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def async_url(url):
+    scheme, sep, rest = url.partition("://")
+    driver = ASYNC_DRIVERS.get(scheme.split("+")[0])
+    if driver is None:
+        raise ValueError(f"No async driver for {scheme!r}")
+    return driver + sep + rest
+
+
+class HttpError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+class PooledWsgiInstance(WsgiToAsgiInstance):
+    # di asgiref restano lettura del body, build_environ e start_response;
+    # l'esecuzione dell'app WSGI è qui, nel pool invece che nel thread condiviso
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        await sync_to_async(self.run_wsgi, thread_sensitive=False, executor=self.executor)(body)
+
+    def run_wsgi(self, body):
+        try:
+            environ = self.build_environ(self.scope, body)
+        except ValueError:  # troppi header duplicati
+            self.sync_send({"type": "http.response.start", "status": 400,
+                            "headers": [(b"content-type", b"text/plain")]})
+            self.sync_send({"type": "http.response.body", "body": b"Bad Request"})
+            return
+
+        output = self.wsgi_application(environ, self.start_response)
+        try:
+            sent = 0
+            for chunk in output:
+                if not self.response_started:
+                    self.response_started = True
+                    self.sync_send(self.response_start)
+                if self.response_content_length is not None:
+                    chunk = chunk[:self.response_content_length - sent]
+                self.sync_send({"type": "http.response.body", "body": chunk, "more_body": True})
+                sent += len(chunk)
+                if sent == self.response_content_length:
+                    break
+        finally:
+            # PEP 3333: close() anche se il client se n'è andato (chiude gli stream SSE)
+            if hasattr(output, "close"):
+                output.close()
+        if not self.response_started:
+            self.response_started = True
+            self.sync_send(self.response_start)
+        self.sync_send({"type": "http.response.body"})
+
+
+class PooledWsgiToAsgi(WsgiToAsgi):
+    def __init__(self, wsgi_application, threads):
+        super().__init__(wsgi_application)
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi")
+
+    async def __call__(self, scope, receive, send):
+        await PooledWsgiInstance(self.wsgi_application, self.executor)(scope, receive, send)
+
+
+class Request:
+    __slots__ = ("method", "path", "headers", "args")
+
+    def __init__(self, scope):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        self.args = {k: v[0] for k, v in parse_qs(scope["query_string"].decode()).items()}
+
+    def if_none_match(self):
+        value = self.headers.get("if-none-match", "")
+        return {tag.strip().removeprefix("W/").strip('"') for tag in value.split(",") if tag.strip()}
+
+
+class AsyncApi:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.config = flask_app.config
+        self.fallback = PooledWsgiToAsgi(flask_app, int(os.getenv("ASGI_WSGI_THREADS", "32")))
+        publisher.fit_threads(self.fallback.threads, self.config["SSE_SPARE_THREADS"])
+
+        url = self.config["SQLALCHEMY_DATABASE_URI"]
+        settings = self.config["DB_PROFILE_SETTINGS"]
+        options = db_profiles.engine_options(url, settings)
+        if options.pop("connect_args", None):
+            # asyncpg: statement_timeout come server_settings invece di "-c ..."
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(settings["statement_timeout_ms"])}}
+        self.engine = create_async_engine(async_url(url), **options)
+        if url.startswith("sqlite"):
+            db_profiles.install_pragmas(self.engine.sync_engine, settings)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)
+
+        cors = os.getenv("CORS_ORIGINS", "*").strip()
+        self.cors_origins = None if cors == "*" else {o.strip() for o in cors.split(",") if o.strip()}
+        self.routes = {
+            "/api/health": self.health,
+            "/api/me": self.me,
+            "/api/slots": self.slots,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        bus.start()  # come before_request nell'app Flask
+        handler = self.routes.get(scope["path"]) if scope["type"] == "http" and scope["method"] == "GET" else None
+        if handler is None:
+            return await self.fallback(scope, receive, send)
+
+        req = Request(scope)
+        try:
+            status, body, headers = await handler(req)
+        except HttpError as e:
+            status, body, headers = e.status, {"error": e.message}, e.headers
+        await self.respond(send, req, status, body, headers)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.engine.dispose()
+                self.fallback.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def respond(self, send, req, status, body, headers):
+        payload = b"" if body is None else json.dumps(body, sort_keys=True, separators=(",", ":")).encode()
+        headers = dict(headers)
+        if body is not None:
+            headers["Content-Type"] = "application/json"
+        headers["Content-Length"] = str(len(payload))
+        origin = req.headers.get("origin")
+        if origin and (self.cors_origins is None or origin in self.cors_origins):
+            # come Flask-Cors con supports_credentials: origine riflessa
+            headers["Access-Control-Allow-Origin"] = origin
+            headers["Access-Control-Allow-Credentials"] = "true"
+            headers["Vary"] = "Origin"
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        })
+        await send({"type": "http.response.body", "body": payload})
+
+    async def run_in_app(self, fn, *args):
+        # codice sincrono che usa db.session (es. ricompilare l'orario) in un thread
+        def call():
+            with self.flask_app.app_context():
+                return fn(*args)
+        return await asyncio.to_thread(call)
+
+    async def authenticate(self, req, trust_claims=False):
+        # stessi controlli di app.auth.authenticate
+        auth = req.headers.get("authorization", "")
+        if not auth.startswith("Bearer "):
+            raise HttpError(401, "Missing token")
+        try:
+            user_id, payload = read_token(auth.split(" ", 1)[1].strip(), self.config["JWT_SECRET"])
+        except Exception:
+            raise HttpError(401, "Invalid token")
+
+        # stesso limite "read" di require_auth (solo GET passano di qui)
+        wait = rate_limiter.take("read", user_id)
+        if wait:
+            raise HttpError(429, "Too many requests", {"Retry-After": str(math.ceil(wait))})
+
+        if trust_claims and self.config.get("AUTH_TRUST_CLAIMS"):
+            return AuthUser(user_id, ruolo=payload.get("ruolo", "USER"))
+
+        user = user_cache.get(user_id)
+        if user is None:
+            async with self.session() as session:
+                row = await session.get(User, user_id)
+            if row is None:
+                raise HttpError(401, "User not found")
+            user = AuthUser.from_user(row)
+            user_cache.put(user)
+        return user
+
+    async def health(self, req):
+        return 200, {"ok": True}, {}
+
+    async def me(self, req):
+        user = await self.authenticate(req)
+        return 200, {"user": user.to_safe_dict()}, {}
+
+    async def slots(self, req):
+        # come routes.get_slots_for_date
+        user = await self.authenticate(req, trust_claims=True)
+        date_str = req.args.get("date", "").strip()
+        impianto = (req.args.get("impianto") or "").strip().upper()
+        if not date_str:
+            raise HttpError(400, "Missing date")
+        try:
+            d = datetime.strptime(date_str, "%Y-%m-%d").date()
+        except ValueError:
+            raise HttpError(400, "Invalid date")
+
+        async with self.session() as session:
+            my_booked = set((await session.execute(
+                select(Prenotazione.slot_id).where(Prenotazione.data == d, Prenotazione.user_id == user.id)
+            )).scalars())
+
+            etag = slots_etag(d, date_str, impianto, user.id, my_booked)
+            cache_headers = {"ETag": f'"{etag}"', "Cache-Control": "private, no-cache"}
+            if etag in req.if_none_match():
+                return 304, None, cache_headers
+
+            cached = availability_cache.get(d, impianto)
+            if cached is not None:
+                slots, counts = cached
+            else:
+                version = availability_cache.version(d)
+                day = schedule.peek(d.weekday() + 1, impianto)
+                if day is None:
+                    day = await self.run_in_app(schedule.for_date, d, impianto)
+                slots = [s.data for s in day]
+                counts = dict((await session.execute(
+                    select(Prenotazione.slot_id, func.count(Prenotazione.id))
+                    .where(Prenotazione.data == d)
+                    .group_by(Prenotazione.slot_id)
+                )).all())
+                availability_cache.put(d, impianto, slots, counts, version)
+
+        result = [slot_availability(s, counts.get(s["id"], 0), my_booked) for s in slots]
+        return 200, {"date": date_str, "slots": result}, cache_headers
+
+
+def create_asgi_app():
+    return AsyncApi(create_app())
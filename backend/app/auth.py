@@ -1,47 +1,188 @@
 import os
+import threading
+import time
 import jwt
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from functools import wraps
 from flask import request, jsonify, current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 from werkzeug.security import check_password_hash
 
 from app import db
 from app.models import User
+from app.ratelimit import rate_limiter
+from app.bus import bus
 
 def create_token(user: User) -> str:
     secret = current_app.config["JWT_SECRET"]
     payload = {
-        "sub": user.id,
+        "sub": str(user.id),  # PyJWT >= 2.10 accetta solo "sub" stringa
         "ruolo": user.ruolo,
         "exp": datetime.utcnow() + timedelta(hours=12),
         "iat": datetime.utcnow(),
     }
     return jwt.encode(payload, secret, algorithm="HS256")
 
-def decode_token(token: str):
-    secret = current_app.config["JWT_SECRET"]
+def decode_token(token: str, secret=None):
+    secret = secret or current_app.config["JWT_SECRET"]
     return jwt.decode(token, secret, algorithms=["HS256"])
 
-def get_bearer_token():
+def read_token(token, secret=None):
+    # (user_id, payload); solleva eccezione se il token non è valido.
+    # Usata anche dal server ASGI (app.asgi), fuori dal contesto Flask.
+    payload = decode_token(token, secret)
+    return int(payload["sub"]), payload
+
+def get_bearer_token(allow_query_token=False):
     auth = request.headers.get("Authorization", "")
     if not auth.startswith("Bearer "):
+        if allow_query_token:
+            return request.args.get("access_token") or None
         return None
     return auth.split(" ", 1)[1].strip()
 
-def require_auth(fn):
+class AuthUser:
+    # Campi di User che servono alle route (to_safe_dict); niente sessione ORM.
+    __slots__ = ("id", "nome", "cognome", "gruppo", "ruolo", "email")
+
+    def __init__(self, id, nome=None, cognome=None, gruppo=None, ruolo="USER", email=None):
+        self.id = id
+        self.nome = nome
+        self.cognome = cognome
+        self.gruppo = gruppo
+        self.ruolo = ruolo
+        self.email = email
+
+    @classmethod
+    def from_user(cls, user: User):
+        return cls(user.id, user.nome, user.cognome, user.gruppo, user.ruolo, user.email)
+
+    def to_safe_dict(self):
+        return {
+            "id": self.id,
+            "nome": self.nome,
+            "cognome": self.cognome,
+            "gruppo": self.gruppo,
+            "ruolo": self.ruolo,
+            "email": self.email,
+        }
+
+class UserCache:
+    # Cache per-worker degli utenti autenticati (id -> AuthUser) con TTL breve,
+    # così require_auth non fa una query a ogni richiesta.
+
+    def __init__(self, maxsize=1024, ttl=30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # id -> (scadenza, AuthUser)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.maxsize = int(app.config.get("USER_CACHE_SIZE", self.maxsize))
+        self.ttl = float(app.config.get("USER_CACHE_TTL", self.ttl))
+        self.clear()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, auth_user):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[auth_user.id] = (time.monotonic() + self.ttl, auth_user)
+            self._entries.move_to_end(auth_user.id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+user_cache = UserCache()
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _user_changed(mapper, connection, target):
+    user_cache.invalidate(target.id)
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_users", set()).add(target.id)
+
+@event.listens_for(Session, "do_orm_execute")
+def _user_bulk_changed(state):
+    # User.query.update(...) / delete(...) non passano da after_update
+    if (state.is_update or state.is_delete) and any(m.class_ is User for m in state.all_mappers):
+        user_cache.clear()
+        state.session.info.setdefault("changed_users", set()).add(None)
+
+@event.listens_for(Session, "after_commit")
+def _publish_user_changes(session):
+    # agli altri worker solo a modifica committata (None = tutti gli utenti)
+    for user_id in session.info.pop("changed_users", ()):
+        bus.publish("user", user_id=user_id)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_user_changes(session):
+    session.info.pop("changed_users", None)
+
+def load_auth_user(user_id):
+    auth_user = user_cache.get(user_id)
+    if auth_user is None:
+        user = db.session.get(User, user_id)
+        if not user:
+            return None
+        auth_user = AuthUser.from_user(user)
+        user_cache.put(auth_user)
+    return auth_user
+
+def authenticate(trust_claims=False, allow_query_token=False):
+    # ritorna (AuthUser, None) oppure (None, risposta di errore)
+    token = get_bearer_token(allow_query_token)
+    if not token:
+        return None, (jsonify({"error": "Missing token"}), 401)
+    try:
+        user_id, payload = read_token(token)
+    except Exception:
+        return None, (jsonify({"error": "Invalid token"}), 401)
+
+    if trust_claims and current_app.config.get("AUTH_TRUST_CLAIMS"):
+        # endpoint in sola lettura: bastano id e ruolo firmati nel token
+        return AuthUser(user_id, ruolo=payload.get("ruolo", "USER")), None
+
+    user = load_auth_user(user_id)
+    if not user:
+        return None, (jsonify({"error": "User not found"}), 401)
+    return user, None
+
+def require_auth(fn=None, *, trust_claims=False, allow_query_token=False):
+    # @require_auth oppure @require_auth(trust_claims=True) per endpoint in sola
+    # lettura che usano solo request.user.id (attivo se AUTH_TRUST_CLAIMS=1);
+    # allow_query_token: token anche in ?access_token= (EventSource/SSE)
+    if fn is None:
+        return lambda f: require_auth(f, trust_claims=trust_claims, allow_query_token=allow_query_token)
+
     @wraps(fn)
     def wrapper(*args, **kwargs):
-        token = get_bearer_token()
-        if not token:
-            return jsonify({"error": "Missing token"}), 401
-        try:
-            payload = decode_token(token)
-        except Exception:
-            return jsonify({"error": "Invalid token"}), 401
-
-        user = db.session.get(User, payload.get("sub"))
-        if not user:
-            return jsonify({"error": "User not found"}), 401
+        user, error = authenticate(trust_claims, allow_query_token)
+        if error:
+            return error
+        limited = rate_limiter.check("read" if request.method in ("GET", "HEAD") else "write", user.id)
+        if limited:
+            return limited
 
         request.user = user
         return fn(*args, **kwargs)
@@ -50,17 +191,9 @@ def require_auth(fn):
 def require_admin(fn):
     @wraps(fn)
     def wrapper(*args, **kwargs):
-        token = get_bearer_token()
-        if not token:
-            return jsonify({"error": "Missing token"}), 401
-        try:
-            payload = decode_token(token)
-        except Exception:
-            return jsonify({"error": "Invalid token"}), 401
-
-        user = db.session.get(User, payload.get("sub"))
-        if not user:
-            return jsonify({"error": "User not found"}), 401
+        user, error = authenticate()
+        if error:
+            return error
         if user.ruolo != "ADMIN":
             return jsonify({"error": "Admin only"}), 403
 
@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class AvailabilityCache:
+    # Cache in-process della disponibilità per (data, impianto):
+    # lista slot attivi del giorno + conteggio prenotazioni per slot.
+    # LRU con dimensione massima e TTL; book()/cancel_booking() la aggiornano
+    # in modo incrementale (apply_delta) invece di svuotarla.
+
+    def __init__(self, maxsize=256, ttl=30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (data, impianto) -> (scadenza, slots, counts)
+        self._versions = {}  # data -> contatore modifiche
+        self._epoch = 0  # incrementato quando cambiano gli slot
+        self._instance = f"{os.getpid():x}{int(time.time()):x}"
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.maxsize = int(app.config.get("AVAILABILITY_CACHE_SIZE", self.maxsize))
+        self.ttl = float(app.config.get("AVAILABILITY_CACHE_TTL", self.ttl))
+        self.clear()
+
+    def after_fork(self):
+        # worker creato da un master con l'app già caricata: stesso pid/ora del
+        # master negli ETag di tutti i worker, che invece hanno versioni proprie
+        with self._lock:
+            self._instance = f"{os.getpid():x}{int(time.time()):x}"
+
+    def version(self, d):
+        with self._lock:
+            return self._epoch, self._versions.get(d, 0)
+
+    def version_tag(self, d=None):
+        # base degli ETag: processo + versione slot + versione della data.
+        # Le versioni sono per-worker, quindi l'ETag scade comunque ogni TTL
+        # (finestra temporale) per non servire 304 su dati cambiati altrove.
+        epoch, v = self.version(d)
+        window = int(time.time() // self.ttl) if self.ttl > 0 else 0
+        return f"{self._instance}.{epoch}.{v}.{window}"
+
+    def get(self, d, impianto):
+        if self.maxsize <= 0:
+            return None
+        key = (d, impianto)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, slots, counts = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return slots, dict(counts)
+
+    def put(self, d, impianto, slots, counts, version):
+        # version = self.version(d) letto PRIMA delle query: se nel frattempo
+        # c'è stata una prenotazione/cancellazione i dati sono già vecchi.
+        if self.maxsize <= 0:
+            return
+        key = (d, impianto)
+        with self._lock:
+            if (self._epoch, self._versions.get(d, 0)) != version:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, slots, dict(counts))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def apply_delta(self, d, slot_id, delta):
+        with self._lock:
+            self._versions[d] = self._versions.get(d, 0) + 1
+            for (day, _), (_, slots, counts) in self._entries.items():
+                if day != d or not any(s["id"] == slot_id for s in slots):
+                    continue
+                counts[slot_id] = max(counts.get(slot_id, 0) + delta, 0)
+
+    def set_count(self, d, slot_id, prenotati):
+        # valore assoluto appena letto dal DB (RETURNING del contatore)
+        with self._lock:
+            self._versions[d] = self._versions.get(d, 0) + 1
+            for (day, _), (_, slots, counts) in self._entries.items():
+                if day == d and any(s["id"] == slot_id for s in slots):
+                    counts[slot_id] = prenotati
+
+    def drop_date(self, d):
+        # data cambiata in un altro worker (app.bus): si ricarica alla prossima richiesta
+        with self._lock:
+            self._versions[d] = self._versions.get(d, 0) + 1
+            for key in [k for k in self._entries if k[0] == d]:
+                del self._entries[key]
+
+    def clear(self):
+        # slot creati/modificati dall'admin: la lista slot non è più valida
+        with self._lock:
+            self._entries.clear()
+            self._epoch += 1
+
+
+availability_cache = AvailabilityCache()
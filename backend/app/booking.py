@@ -0,0 +1,325 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, literal, select, update, delete
+from sqlalchemy.exc import DBAPIError
+
+from app import db
+from app.models import Prenotazione, SeriePrenotazione, SlotOccupancy
+from app.schedule import schedule
+
+
+class BookingError(Exception):
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+# PostgreSQL: serialization_failure, deadlock_detected; SQLite: lock non ottenuto entro busy_timeout
+_RETRYABLE_PGCODES = ("40001", "40P01")
+
+
+def _retryable(exc):
+    orig = getattr(exc, "orig", None)
+    if getattr(orig, "pgcode", None) in _RETRYABLE_PGCODES:
+        return True
+    return "database is locked" in str(orig)
+
+
+def _insert(table):
+    # INSERT ... ON CONFLICT esiste sia su SQLite (>= 3.24) che su PostgreSQL
+    if db.engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+
+def _reserve_stmt(slot_id, d, capienza):
+    # Un solo statement: crea il contatore (slot, data) partendo dalle prenotazioni
+    # esistenti oppure lo incrementa, ma solo se c'è ancora posto.
+    # Su PostgreSQL la riga del contatore resta bloccata fino al commit, su SQLite
+    # il lock di scrittura è sull'intero DB: nessun check-then-act tra worker.
+    current = (
+        select(func.count(Prenotazione.id).label("n"))
+        .where(Prenotazione.slot_id == slot_id, Prenotazione.data == d)
+        .subquery()
+    )
+    initial = select(literal(slot_id), literal(d, db.Date), current.c.n + 1)
+    if capienza is not None:
+        initial = initial.where(current.c.n < capienza)
+    else:
+        # SQLite: INSERT ... SELECT ... ON CONFLICT richiede un WHERE nella SELECT
+        initial = initial.where(literal(True))
+
+    stmt = _insert(SlotOccupancy).from_select(["slot_id", "data", "prenotati"], initial)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["slot_id", "data"],
+        set_={"prenotati": SlotOccupancy.prenotati + 1},
+        where=(SlotOccupancy.prenotati < capienza) if capienza is not None else None,
+    )
+    return stmt.returning(SlotOccupancy.prenotati)
+
+
+def _decrement(slot_id, d):
+    return db.session.execute(
+        update(SlotOccupancy)
+        .where(SlotOccupancy.slot_id == slot_id, SlotOccupancy.data == d, SlotOccupancy.prenotati > 0)
+        .values(prenotati=SlotOccupancy.prenotati - 1)
+        .returning(SlotOccupancy.prenotati)
+    ).scalar()
+
+
+def reserve(user_id, slot, d):
+    # Prenota senza commit; ritorna (booking_id, prenotati dopo l'inserimento).
+    # Se solleva BookingError non lascia modifiche nella transazione, quindi
+    # più operazioni possono stare nella stessa transazione (batch).
+    prenotati = db.session.execute(_reserve_stmt(slot.id, d, slot.capienza)).scalar()
+    if prenotati is None:
+        raise BookingError("Full", 409)
+
+    stmt = _insert(Prenotazione).values(
+        user_id=user_id, slot_id=slot.id, data=d, timestamp_creazione=datetime.utcnow()
+    ).on_conflict_do_nothing().returning(Prenotazione.id)
+    booking_id = db.session.execute(stmt).scalar()
+    if booking_id is None:
+        _decrement(slot.id, d)  # restituisco il posto appena riservato
+        raise BookingError("Already booked", 409)
+
+    return booking_id, prenotati
+
+
+def release(user_id, slot_id, d):
+    # Cancella senza commit; ritorna i prenotati rimasti (None se lo slot/data
+    # non ha ancora un contatore, es. prenotazioni precedenti al contatore).
+    deleted = db.session.execute(
+        delete(Prenotazione)
+        .where(Prenotazione.user_id == user_id, Prenotazione.slot_id == slot_id, Prenotazione.data == d)
+        .returning(Prenotazione.id)
+    ).first()
+    if deleted is None:
+        raise BookingError("Not booked", 404)
+
+    return _decrement(slot_id, d)
+
+
+def series_dates(giorno_settimana, d_from, d_to):
+    # date del periodo che cadono nel giorno dello slot (1=Lun..7=Dom)
+    first = d_from + timedelta(days=(giorno_settimana - 1 - d_from.weekday()) % 7)
+    dates = []
+    while first <= d_to:
+        dates.append(first)
+        first += timedelta(days=7)
+    return dates
+
+
+def book_series(user_id, slot, d_from, d_to):
+    # Prenotazione settimanale: stesse garanzie di reserve() ma con statement
+    # d'insieme su tutte le date invece di uno per data. Contatori mancanti
+    # creati da una sola GROUP BY, poi un UPDATE condizionato "prenotati <
+    # capienza" con data IN (...) riserva un posto in ogni data che ne ha
+    # ancora (atomico come _reserve_stmt), infine un INSERT multiplo.
+    # Ritorna (serie o None, {data: prenotati}, date piene, date già prenotate);
+    # se nessuna data entra la serie non viene creata.
+    dates = series_dates(slot.giorno_settimana, d_from, d_to)
+    try:
+        mine = set(db.session.scalars(
+            select(Prenotazione.data)
+            .where(Prenotazione.user_id == user_id, Prenotazione.slot_id == slot.id, Prenotazione.data.in_(dates))
+        ))
+        todo = [d for d in dates if d not in mine]
+        reserved, booked = {}, {}
+        if todo:
+            counts = dict(db.session.execute(
+                select(Prenotazione.data, func.count(Prenotazione.id))
+                .where(Prenotazione.slot_id == slot.id, Prenotazione.data.in_(todo))
+                .group_by(Prenotazione.data)
+            ).all())
+            db.session.execute(_insert(SlotOccupancy).values([
+                {"slot_id": slot.id, "data": d, "prenotati": counts.get(d, 0)} for d in todo
+            ]).on_conflict_do_nothing())
+
+            stmt = update(SlotOccupancy).where(SlotOccupancy.slot_id == slot.id, SlotOccupancy.data.in_(todo))
+            if slot.capienza is not None:
+                stmt = stmt.where(SlotOccupancy.prenotati < slot.capienza)
+            reserved = dict(db.session.execute(
+                stmt.values(prenotati=SlotOccupancy.prenotati + 1).returning(SlotOccupancy.data, SlotOccupancy.prenotati)
+            ).all())
+
+        full = [d for d in todo if d not in reserved]
+        if not reserved:
+            db.session.rollback()
+            return None, {}, full, sorted(mine)
+
+        serie = SeriePrenotazione(user_id=user_id, slot_id=slot.id, data_inizio=d_from, data_fine=d_to)
+        db.session.add(serie)
+        db.session.flush()
+        now = datetime.utcnow()
+        inserted = set(db.session.scalars(_insert(Prenotazione).values([
+            {"user_id": user_id, "slot_id": slot.id, "data": d, "timestamp_creazione": now, "serie_id": serie.id}
+            for d in sorted(reserved)
+        ]).on_conflict_do_nothing().returning(Prenotazione.data)))
+
+        # prenotate nel frattempo da un'altra richiesta dell'utente: restituisco i posti
+        lost = [d for d in reserved if d not in inserted]
+        if lost:
+            db.session.execute(
+                update(SlotOccupancy)
+                .where(SlotOccupancy.slot_id == slot.id, SlotOccupancy.data.in_(lost))
+                .values(prenotati=SlotOccupancy.prenotati - 1)
+            )
+            mine.update(lost)
+        booked = {d: reserved[d] for d in sorted(inserted)}
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        raise
+    return serie, booked, full, sorted(mine)
+
+
+def cancel_series(user_id, serie_id, since):
+    # cancella le date della serie da "since" in poi (un DELETE, un UPDATE dei
+    # contatori); ritorna (serie, {data: prenotati rimasti})
+    serie = db.session.get(SeriePrenotazione, serie_id)
+    if not serie or serie.user_id != user_id:
+        raise BookingError("Series not found", 404)
+    try:
+        dates = db.session.scalars(
+            delete(Prenotazione)
+            .where(Prenotazione.serie_id == serie_id, Prenotazione.user_id == user_id, Prenotazione.data >= since)
+            .returning(Prenotazione.data)
+        ).all()
+        counts = {}
+        if dates:
+            counts = dict(db.session.execute(
+                update(SlotOccupancy)
+                .where(SlotOccupancy.slot_id == serie.slot_id, SlotOccupancy.data.in_(dates), SlotOccupancy.prenotati > 0)
+                .values(prenotati=SlotOccupancy.prenotati - 1)
+                .returning(SlotOccupancy.data, SlotOccupancy.prenotati)
+            ).all())
+        serie.attiva = False
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        raise
+    return serie, {d: counts.get(d) for d in sorted(dates)}
+
+
+def book(user_id, slot, d):
+    try:
+        result = reserve(user_id, slot, d)
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        raise
+    return result
+
+
+def cancel(user_id, slot_id, d):
+    try:
+        prenotati = release(user_id, slot_id, d)
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        raise
+    return prenotati
+
+
+def apply_batch(user_id, items, atomic=True):
+    # items: [{"op": "book"|"cancel", "slot_id": int, "data": date}] oppure con
+    # "error" già impostato dal parsing. Validazione con l'orario compilato e
+    # query d'insieme (prenotazioni dell'utente, conteggi), poi applicazione in un'unica
+    # transazione. atomic=True: tutto o niente; altrimenti best-effort.
+    # Ritorna (ok, changes) e scrive in ogni item "ok"/"error"/"status";
+    # changes = [(data, slot_id, prenotati, delta)] per aggiornare le cache.
+    valid = [it for it in items if "error" not in it]
+    slot_ids = {it["slot_id"] for it in valid}
+    dates = {it["data"] for it in valid}
+
+    slots, mine, counts = {}, set(), {}
+    if valid:
+        slots = {slot_id: schedule.get(slot_id) for slot_id in slot_ids}
+        mine = set(
+            db.session.query(Prenotazione.slot_id, Prenotazione.data)
+            .filter(Prenotazione.user_id == user_id, Prenotazione.slot_id.in_(slot_ids), Prenotazione.data.in_(dates))
+            .all()
+        )
+        counts = {
+            (slot_id, d): n
+            for slot_id, d, n in db.session.query(Prenotazione.slot_id, Prenotazione.data, func.count(Prenotazione.id))
+            .filter(Prenotazione.slot_id.in_(slot_ids), Prenotazione.data.in_(dates))
+            .group_by(Prenotazione.slot_id, Prenotazione.data)
+        }
+
+    def fail(it, message, status):
+        it["error"] = message
+        it["status"] = status
+
+    seen = set()
+    for it in valid:
+        key = (it["slot_id"], it["data"])
+        if key in seen:
+            fail(it, "Duplicate operation", 400)
+            continue
+        seen.add(key)
+
+        if it["op"] == "cancel":
+            if key not in mine:
+                fail(it, "Not booked", 404)
+            continue
+
+        slot = slots.get(it["slot_id"])
+        if not slot or not slot.attivo:
+            fail(it, "Slot not found/inactive", 404)
+        elif slot.giorno_settimana != it["data"].weekday() + 1:
+            fail(it, "Slot not available on this date", 400)
+        elif key in mine:
+            fail(it, "Already booked", 409)
+        elif slot.capienza is not None and counts.get(key, 0) >= slot.capienza:
+            fail(it, "Full", 409)
+
+    def abort():
+        db.session.rollback()
+        for it in items:
+            if "error" not in it:
+                fail(it, "Not applied", 409)
+            it["ok"] = False
+        return False, []
+
+    if atomic and any("error" in it for it in items):
+        return abort()
+
+    # le cancellazioni prima, così liberano posti per le prenotazioni del batch;
+    # poi per (slot, data): due batch concorrenti bloccano le righe di
+    # slot_occupancy nello stesso ordine e non vanno in deadlock
+    changes = []
+    todo = sorted((it for it in items if "error" not in it),
+                  key=lambda it: (it["op"] != "cancel", it["slot_id"], it["data"]))
+    try:
+        for it in todo:
+            try:
+                if it["op"] == "cancel":
+                    prenotati = release(user_id, it["slot_id"], it["data"])
+                    changes.append((it["data"], it["slot_id"], prenotati, -1))
+                else:
+                    _, prenotati = reserve(user_id, slots[it["slot_id"]], it["data"])
+                    changes.append((it["data"], it["slot_id"], prenotati, +1))
+            except BookingError as e:
+                # reserve/release non lasciano modifiche parziali: si può proseguire
+                fail(it, e.message, e.status)
+                if atomic:
+                    return abort()
+        db.session.commit()
+    except DBAPIError as e:
+        db.session.rollback()
+        if _retryable(e):
+            # niente è stato applicato: il client può riprovare lo stesso batch
+            raise BookingError("Busy, retry", 503) from e
+        raise
+    except BaseException:
+        db.session.rollback()
+        raise
+
+    for it in items:
+        it["ok"] = "error" not in it
+    return all(it["ok"] for it in items), changes
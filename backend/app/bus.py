@@ -0,0 +1,208 @@
+import json
+import logging
+import os
+import select as select_module
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select, text
+
+from app import db
+from app.models import CacheEvent
+
+# Bus di invalidazione tra worker (BUS_TRANSPORT). Cache disponibilità,
+# utenti e orario sono per-processo: dopo il commit un worker pubblica cosa ha
+# cambiato (prenotazione, slot, utente) e gli altri scartano o aggiornano le
+# loro copie. publish() mette il messaggio in una coda in memoria e ritorna
+# subito; un thread per worker lo spedisce e intanto riceve quelli degli altri:
+# - table: tabella cache_events, letta ogni BUS_POLL_INTERVAL secondi con
+#   "id > ultimo visto" (una range scan sulla chiave primaria);
+# - postgres: NOTIFY/LISTEN sul canale sport_cache (psycopg2), niente polling.
+# Il thread parte alla prima richiesta del worker: prima la cache è vuota e
+# non c'è niente da invalidare. Un errore di trasporto svuota tutte le cache
+# locali (dei messaggi potrebbero essere persi).
+
+log = logging.getLogger(__name__)
+
+TRANSPORTS = ("off", "table", "postgres")
+CHANNEL = "sport_cache"
+
+
+class InvalidationBus:
+    def __init__(self, poll_interval=0.025, retention=600.0):
+        self.transport = "off"
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.origin = f"{os.getpid():x}{int(time.time()):x}"
+        self._handlers = {}  # kind -> funzione(payload)
+        self._outbox = deque()
+        self._cond = threading.Condition()
+        self._app = None
+        self._thread = None
+        self._last_id = 0
+        self._last_prune = 0.0
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+
+    def init_app(self, app):
+        transport = app.config.get("BUS_TRANSPORT", "off")
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Unknown BUS_TRANSPORT {transport!r} ({', '.join(TRANSPORTS)})")
+        if transport == "postgres" and not app.config["SQLALCHEMY_DATABASE_URI"].startswith("postgres"):
+            raise ValueError("BUS_TRANSPORT=postgres needs a PostgreSQL DATABASE_URL")
+        self.transport = transport
+        self.poll_interval = float(app.config.get("BUS_POLL_INTERVAL", self.poll_interval))
+        self.retention = float(app.config.get("BUS_RETENTION", self.retention))
+        self._app = app
+
+    @property
+    def enabled(self):
+        return self.transport != "off"
+
+    def handler(self, kind):
+        # @bus.handler("booking"): applica un messaggio arrivato da un altro worker
+        def register(fn):
+            self._handlers[kind] = fn
+            return fn
+        return register
+
+    def start(self):
+        # chiamata a ogni richiesta (create_app): il thread parte alla prima
+        if not self.enabled or self._thread is not None:
+            return
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="invalidation-bus", daemon=True)
+                self._thread.start()
+
+    def after_fork(self):
+        self.origin = f"{os.getpid():x}{int(time.time()):x}"
+
+    def publish(self, kind, **payload):
+        # dopo il commit; senza thread avviato (script, trasporto off) non fa niente
+        if self._thread is None:
+            return
+        with self._cond:
+            self._outbox.append((kind, payload))
+            self._cond.notify()
+
+    def dispatch(self, kind, payload):
+        fn = self._handlers.get(kind)
+        if fn is not None:
+            fn(payload)
+
+    def reset(self):
+        # messaggi forse persi: l'handler "reset" scarta tutte le cache locali
+        self.dispatch("reset", {})
+
+    def metrics_lines(self):
+        return [
+            "# TYPE sport_bus_published_total counter",
+            f"sport_bus_published_total {self.published}",
+            "# TYPE sport_bus_received_total counter",
+            f"sport_bus_received_total {self.received}",
+            "# TYPE sport_bus_errors_total counter",
+            f"sport_bus_errors_total {self.errors}",
+        ]
+
+    def _take_outbox(self, timeout):
+        with self._cond:
+            if not self._outbox and timeout:
+                self._cond.wait(timeout)
+            batch = list(self._outbox)
+            self._outbox.clear()
+        return batch
+
+    def _run(self):
+        with self._app.app_context():
+            while True:
+                try:
+                    if self.transport == "postgres":
+                        self._run_postgres()
+                    else:
+                        self._run_table()
+                except Exception:
+                    self.errors += 1
+                    log.exception("bus di invalidazione: errore di trasporto")
+                    db.session.rollback()
+                    self.reset()
+                    time.sleep(1)
+                finally:
+                    db.session.remove()
+
+    # --- table ---
+
+    def _run_table(self):
+        self._last_id = db.session.execute(select(func.max(CacheEvent.id))).scalar() or 0
+        db.session.commit()
+        while True:
+            batch = self._take_outbox(self.poll_interval)
+            if batch:
+                now = datetime.utcnow()
+                db.session.execute(insert(CacheEvent), [
+                    {"origin": self.origin, "kind": kind, "payload": json.dumps(payload), "timestamp_creazione": now}
+                    for kind, payload in batch
+                ])
+                db.session.commit()
+                self.published += len(batch)
+
+            rows = db.session.execute(
+                select(CacheEvent.id, CacheEvent.origin, CacheEvent.kind, CacheEvent.payload)
+                .where(CacheEvent.id > self._last_id)
+                .order_by(CacheEvent.id)
+            ).all()
+            # fine della lettura: su SQLite una transazione aperta blocca il checkpoint WAL
+            db.session.commit()
+            for event_id, origin, kind, payload in rows:
+                self._last_id = event_id
+                if origin != self.origin:
+                    self.received += 1
+                    self.dispatch(kind, json.loads(payload))
+            self._prune()
+
+    def _prune(self):
+        now = time.monotonic()
+        if now - self._last_prune < self.retention / 10:
+            return
+        self._last_prune = now
+        cutoff = datetime.utcnow() - timedelta(seconds=self.retention)
+        db.session.execute(delete(CacheEvent).where(CacheEvent.timestamp_creazione < cutoff))
+        db.session.commit()
+
+    # --- postgres ---
+
+    def _run_postgres(self):
+        # connessione dedicata in autocommit per LISTEN; le NOTIFY partono dalla
+        # sessione normale (consegnate al commit)
+        raw = db.engine.raw_connection()
+        try:
+            conn = raw.driver_connection
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+            while True:
+                batch = self._take_outbox(0)
+                if batch:
+                    for kind, payload in batch:
+                        message = json.dumps({"origin": self.origin, "kind": kind, "payload": payload})
+                        db.session.execute(text("SELECT pg_notify(:channel, :message)"),
+                                           {"channel": CHANNEL, "message": message})
+                    db.session.commit()
+                    self.published += len(batch)
+
+                if select_module.select([conn], [], [], self.poll_interval) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    message = json.loads(conn.notifies.pop(0).payload)
+                    if message["origin"] != self.origin:
+                        self.received += 1
+                        self.dispatch(message["kind"], message["payload"])
+        finally:
+            raw.invalidate()
+
+
+bus = InvalidationBus()
@@ -0,0 +1,104 @@
+import os
+
+from sqlalchemy import event
+
+from app import db
+
+# Profili del motore DB (DB_PROFILE). "auto" sceglie in base all'URL:
+# - sqlite: WAL (le letture non aspettano le scritture), synchronous=NORMAL
+#   (sicuro con WAL, un fsync per checkpoint invece che per commit),
+#   busy_timeout per aspettare il lock invece di "database is locked";
+# - postgres: pool dimensionato per i thread di un worker, pre-ping (Render
+#   chiude le connessioni inattive), recycle e statement_timeout lato server.
+# "none" lascia i default del driver. Ogni valore si può sovrascrivere con la
+# variabile DB_<CHIAVE> (es. DB_POOL_SIZE=20, DB_STATEMENT_TIMEOUT_MS=0).
+
+PROFILES = {
+    "none": {},
+    "sqlite": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout_ms": 5000,
+        "cache_size_kb": 20000,
+    },
+    "sqlite-durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "busy_timeout_ms": 5000,
+        "cache_size_kb": 20000,
+    },
+    "postgres": {
+        "pool_size": 10,
+        "max_overflow": 10,
+        "pool_timeout": 10,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+        "statement_timeout_ms": 5000,
+    },
+}
+
+_INT_KEYS = {"busy_timeout_ms", "cache_size_kb", "pool_size", "max_overflow", "pool_timeout", "pool_recycle",
+             "statement_timeout_ms"}
+
+
+def resolve(name, database_url):
+    name = (name or "auto").strip().lower()
+    if name == "auto":
+        name = "postgres" if database_url.startswith("postgres") else "sqlite"
+    if name not in PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE {name!r} ({', '.join(['auto', *PROFILES])})")
+
+    settings = dict(PROFILES[name])
+    for key in set(settings) | _INT_KEYS | {"journal_mode", "synchronous", "pool_pre_ping"}:
+        value = os.getenv(f"DB_{key.upper()}")
+        if value is None:
+            continue
+        if key in _INT_KEYS:
+            settings[key] = int(value)
+        elif key == "pool_pre_ping":
+            settings[key] = value == "1"
+        else:
+            settings[key] = value
+    return name, settings
+
+
+def engine_options(database_url, settings):
+    # -> SQLALCHEMY_ENGINE_OPTIONS (prima di db.init_app)
+    options = {}
+    if database_url.startswith("postgres"):
+        for key in ("pool_size", "max_overflow", "pool_timeout", "pool_recycle", "pool_pre_ping"):
+            if key in settings:
+                options[key] = settings[key]
+        if settings.get("statement_timeout_ms"):
+            options["connect_args"] = {"options": f"-c statement_timeout={settings['statement_timeout_ms']}"}
+    return options
+
+
+def init_app(app, settings):
+    app.config["DB_PROFILE_SETTINGS"] = settings
+    if app.config["SQLALCHEMY_DATABASE_URI"].startswith("sqlite"):
+        with app.app_context():
+            install_pragmas(db.engine, settings)
+
+
+def install_pragmas(engine, settings):
+    # PRAGMA SQLite a ogni nuova connessione del pool (anche engine async: sync_engine)
+    pragmas = []
+    if settings.get("journal_mode"):
+        pragmas.append(f"PRAGMA journal_mode={settings['journal_mode']}")
+    if settings.get("synchronous"):
+        pragmas.append(f"PRAGMA synchronous={settings['synchronous']}")
+    if settings.get("busy_timeout_ms") is not None:
+        pragmas.append(f"PRAGMA busy_timeout={int(settings['busy_timeout_ms'])}")
+    if settings.get("cache_size_kb"):
+        pragmas.append(f"PRAGMA cache_size=-{int(settings['cache_size_kb'])}")
+    if not pragmas:
+        return
+
+    def set_pragmas(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    event.listen(engine, "connect", set_pragmas)
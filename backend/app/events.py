@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+RESET = "reset"
+
+
+class AvailabilityPublisher:
+    # Fan-out in-process delle variazioni di disponibilità verso gli stream SSE
+    # (GET /api/slots/stream). Un commit di book()/cancel_booking() pubblica un
+    # evento in un ring buffer limitato e sveglia tutti gli iscritti: nessuna
+    # query per iscritto. Gli id evento sono "<epoch>-<n>": l'epoch identifica
+    # il processo, così un Last-Event-ID di un altro worker (o troppo vecchio
+    # per il buffer) produce un evento "reset" e il client ricarica /api/slots.
+
+    def __init__(self, buffer_size=1024, max_streams=50, heartbeat=15.0):
+        self.buffer_size = buffer_size
+        self.max_streams = max_streams
+        self.heartbeat = heartbeat
+        self.epoch = f"{os.getpid():x}{int(time.time()):x}"
+        self._buffer = deque(maxlen=buffer_size)  # (n, data, payload)
+        self._last = 0
+        self._streams = 0
+        self._subscribers = {}  # data -> numero di stream aperti
+        self._cond = threading.Condition()
+
+    def init_app(self, app):
+        self.buffer_size = int(app.config.get("SSE_BUFFER_SIZE", self.buffer_size))
+        self.max_streams = int(app.config.get("SSE_MAX_STREAMS", self.max_streams))
+        self.heartbeat = float(app.config.get("SSE_HEARTBEAT", self.heartbeat))
+        with self._cond:
+            self._buffer = deque(self._buffer, maxlen=self.buffer_size)
+
+    def fit_threads(self, threads, spare):
+        # ogni stream occupa un thread del server finché resta aperto: il limite
+        # lascia sempre `spare` thread liberi per login, prenotazioni e il resto
+        self.max_streams = max(min(self.max_streams, threads - spare), 0)
+
+    def after_fork(self):
+        # ogni worker ha il suo epoch anche se l'app è stata creata nel master
+        with self._cond:
+            self.epoch = f"{os.getpid():x}{int(time.time()):x}"
+
+    def has_subscribers(self, d):
+        return self._subscribers.get(d, 0) > 0
+
+    def publish(self, d, slot_id, prenotati, capienza):
+        payload = {
+            "slot_id": slot_id,
+            "prenotati": prenotati,
+            "rimasti": None if capienza is None else max(capienza - prenotati, 0),
+            "pieno": capienza is not None and prenotati >= capienza,
+        }
+        self._append(d, payload)
+
+    def publish_reset(self, d):
+        # la data è cambiata ma il nuovo conteggio non è noto: chi riprende da un
+        # Last-Event-ID precedente riceve "reset" invece di perdere la variazione
+        self._append(d, RESET)
+
+    def _append(self, d, payload):
+        with self._cond:
+            self._last += 1
+            self._buffer.append((self._last, d, payload))
+            self._cond.notify_all()
+
+    def open_stream(self, d):
+        with self._cond:
+            if self._streams >= self.max_streams:
+                return False
+            self._streams += 1
+            self._subscribers[d] = self._subscribers.get(d, 0) + 1
+            return True
+
+    def close_stream(self, d):
+        with self._cond:
+            self._streams -= 1
+            self._subscribers[d] -= 1
+            if not self._subscribers[d]:
+                del self._subscribers[d]
+
+    def _parse_id(self, event_id):
+        epoch, _, n = (event_id or "").partition("-")
+        if epoch != self.epoch or not n.isdigit():
+            return None
+        return int(n)
+
+    def event_id(self, n):
+        return f"{self.epoch}-{n}"
+
+    def subscribe(self, d, last_event_id=None):
+        # genera liste di (n, payload) per la data d; lista vuota = heartbeat;
+        # RESET = eventi persi, il client deve ricaricare lo stato completo
+        with self._cond:
+            last = self._parse_id(last_event_id) if last_event_id else self._last
+            lost = last is None or last > self._last or (bool(self._buffer) and self._buffer[0][0] > last + 1)
+            if lost:
+                last = self._last
+        if lost:
+            yield RESET
+
+        deadline = time.monotonic() + self.heartbeat
+        while True:
+            with self._cond:
+                if self._last == last:
+                    self._cond.wait(max(deadline - time.monotonic(), 0))
+                lost = bool(self._buffer) and self._buffer[0][0] > last + 1
+                events = [] if lost else [(n, p) for n, day, p in self._buffer if n > last and day == d]
+                last = self._last
+
+            if lost or any(p is RESET for _, p in events):
+                yield RESET
+            elif events:
+                yield events
+            elif time.monotonic() >= deadline:
+                yield []
+            else:
+                continue  # eventi di altre date
+            deadline = time.monotonic() + self.heartbeat
+
+
+def format_sse(event, data, event_id=None):
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+publisher = AvailabilityPublisher()
@@ -0,0 +1,64 @@
+import csv
+import io
+
+from app import db
+from app.archive import bookings_source
+from app.models import User, Slot
+
+EXPORT_HEADER = ["Data", "Impianto", "Turno", "Ora inizio", "Ora fine", "Cognome", "Nome", "Gruppo", "Email/Username"]
+
+
+def bookings_query(d_from, d_to, impianto=None, slot_ids=None):
+    # prenotazioni nel periodo (anche archiviate) con slot e utente, già
+    # nell'ordine dello statino
+    p = bookings_source(d_from, d_to)
+    q = (
+        db.session.query(
+            p.c.data,
+            Slot.impianto,
+            Slot.titolo,
+            Slot.ora_inizio,
+            Slot.ora_fine,
+            User.cognome,
+            User.nome,
+            User.gruppo,
+            User.email,
+        )
+        .select_from(p)
+        .join(Slot, Slot.id == p.c.slot_id)
+        .join(User, User.id == p.c.user_id)
+        .filter(p.c.data >= d_from, p.c.data <= d_to)
+    )
+    if impianto:
+        q = q.filter(Slot.impianto == impianto)
+    if slot_ids:
+        q = q.filter(p.c.slot_id.in_(slot_ids))
+
+    return q.order_by(
+        p.c.data.asc(), Slot.ora_inizio.asc(), Slot.id.asc(), User.cognome.asc(), User.nome.asc()
+    )
+
+
+def iter_csv(rows, header=EXPORT_HEADER, page_size=500):
+    # genera il CSV riga per riga: memoria costante qualunque sia il periodo.
+    # yield_per = cursore lato server su PostgreSQL, fetchmany a pagine su SQLite.
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    def flush():
+        chunk = buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+        return chunk
+
+    writer.writerow(header)
+    yield flush()
+
+    for n, row in enumerate(rows.yield_per(page_size), 1):
+        writer.writerow([row[0].isoformat(), *row[1:]])
+        if n % 100 == 0:
+            yield flush()
+
+    tail = flush()
+    if tail:
+        yield tail
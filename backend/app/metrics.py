@@ -0,0 +1,210 @@
+import logging
+import threading
+import time
+
+from flask import g, request
+from sqlalchemy import event
+
+from app import db
+
+# Metriche per endpoint del blueprint api: latenza (istogramma), status,
+# numero/tempo degli statement SQL e righe. Ogni thread scrive solo nel
+# proprio bucket (nessun lock sul percorso della richiesta); GET /api/metrics
+# somma i bucket al momento dello scrape. I dati sono per-worker: con più
+# worker gunicorn ogni scrape vede il worker che risponde.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+log = logging.getLogger("app.sql")
+
+
+class EndpointStats:
+    __slots__ = ("status", "buckets", "count", "seconds", "sql_count", "sql_seconds", "rows")
+
+    def __init__(self):
+        self.status = {}
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+
+    def observe(self, status, seconds, sql_count, sql_seconds, rows):
+        self.status[status] = self.status.get(status, 0) + 1
+        for i, le in enumerate(LATENCY_BUCKETS):
+            if seconds <= le:
+                self.buckets[i] += 1
+                break
+        self.count += 1
+        self.seconds += seconds
+        self.sql_count += sql_count
+        self.sql_seconds += sql_seconds
+        self.rows += rows
+
+    def merge(self, other):
+        for status, n in list(other.status.items()):
+            self.status[status] = self.status.get(status, 0) + n
+        for i, n in enumerate(other.buckets):
+            self.buckets[i] += n
+        self.count += other.count
+        self.seconds += other.seconds
+        self.sql_count += other.sql_count
+        self.sql_seconds += other.sql_seconds
+        self.rows += other.rows
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = True
+        self.server_timing = False
+        self.slow_query_ms = 500.0
+        self._local = threading.local()
+        self._buckets = []  # (thread, {endpoint: EndpointStats})
+        self._retired = {}  # dati dei thread terminati
+        self._collectors = []  # funzioni che aggiungono righe al testo Prometheus
+        self._lock = threading.Lock()  # solo per registrare/unire i bucket
+
+    def init_app(self, app):
+        self.enabled = bool(app.config.get("METRICS_ENABLED", True))
+        self.server_timing = bool(app.config.get("METRICS_SERVER_TIMING", False))
+        self.slow_query_ms = float(app.config.get("SLOW_QUERY_MS", self.slow_query_ms))
+        if not self.enabled:
+            return
+
+        # hook sull'app filtrati sul blueprint "api": il blueprint è condiviso
+        # tra più create_app() (bench, script) e non accetta hook dopo la prima registrazione
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        with app.app_context():
+            event.listen(db.engine, "before_cursor_execute", self._before_cursor)
+            event.listen(db.engine, "after_cursor_execute", self._after_cursor)
+
+    def add_collector(self, fn):
+        # fn() -> righe di testo Prometheus (es. coda di ammissione)
+        if fn not in self._collectors:
+            self._collectors.append(fn)
+
+    def _bucket(self):
+        bucket = getattr(self._local, "bucket", None)
+        if bucket is None:
+            bucket = {}
+            self._local.bucket = bucket
+            with self._lock:
+                self._fold_dead()
+                self._buckets.append((threading.current_thread(), bucket))
+        return bucket
+
+    def _fold_dead(self):
+        # i thread finiti (es. server di sviluppo: un thread per richiesta)
+        # non scrivono più: i loro dati confluiscono in _retired
+        alive = []
+        for thread, bucket in self._buckets:
+            if thread.is_alive():
+                alive.append((thread, bucket))
+            else:
+                for name, stats in bucket.items():
+                    self._retired.setdefault(name, EndpointStats()).merge(stats)
+        self._buckets = alive
+
+    def _before_request(self):
+        if request.blueprint != "api":
+            return
+        local = self._local
+        local.active = True
+        local.sql_count = 0
+        local.sql_seconds = 0.0
+        local.dml_cursors = []
+        g.metrics_start = time.perf_counter()
+
+    def _after_request(self, resp):
+        local = self._local
+        if not getattr(local, "active", False):
+            return resp
+        local.active = False
+        seconds = time.perf_counter() - g.metrics_start
+        name = request.endpoint or "unknown"
+        stats = self._bucket().get(name)
+        if stats is None:
+            stats = self._bucket()[name] = EndpointStats()
+        rows = sum(max(cursor.rowcount, 0) for cursor in local.dml_cursors)
+        local.dml_cursors = []
+        stats.observe(resp.status_code, seconds, local.sql_count, local.sql_seconds, rows)
+
+        if self.server_timing:
+            resp.headers["Server-Timing"] = (
+                f"app;dur={seconds * 1000:.1f}, "
+                f'db;dur={local.sql_seconds * 1000:.1f};desc="{local.sql_count} queries"'
+            )
+        return resp
+
+    def _before_cursor(self, conn, cursor, statement, parameters, context, executemany):
+        # sul contesto dello statement, non sulla connessione: se lo statement
+        # fallisce (lock, deadlock, timeout) after_cursor_execute non arriva e
+        # il contesto se ne va con lui
+        context._metrics_start = time.perf_counter()
+
+    def _after_cursor(self, conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - context._metrics_start
+        local = self._local
+        if getattr(local, "active", False):
+            local.sql_count += 1
+            local.sql_seconds += seconds
+            # solo INSERT/UPDATE/DELETE (per le SELECT sqlite3 riporta sempre -1);
+            # rowcount letto a fine richiesta: con RETURNING è giusto solo dopo il fetch
+            if context.isinsert or context.isupdate or context.isdelete:
+                local.dml_cursors.append(cursor)
+        if self.slow_query_ms and seconds * 1000 >= self.slow_query_ms:
+            log.warning("slow query %.1fms: %s", seconds * 1000, " ".join(statement.split())[:500])
+
+    def snapshot(self):
+        with self._lock:
+            self._fold_dead()
+            total = {}
+            for name, stats in self._retired.items():
+                total.setdefault(name, EndpointStats()).merge(stats)
+            for _, bucket in self._buckets:
+                for name, stats in list(bucket.items()):
+                    total.setdefault(name, EndpointStats()).merge(stats)
+        return total
+
+    def render(self):
+        snapshot = self.snapshot()
+        lines = [
+            "# HELP sport_http_requests_total Richieste per endpoint e status.",
+            "# TYPE sport_http_requests_total counter",
+        ]
+        for name, s in sorted(snapshot.items()):
+            for status, n in sorted(s.status.items()):
+                lines.append(f'sport_http_requests_total{{endpoint="{name}",status="{status}"}} {n}')
+
+        lines += [
+            "# HELP sport_http_request_duration_seconds Latenza per endpoint.",
+            "# TYPE sport_http_request_duration_seconds histogram",
+        ]
+        for name, s in sorted(snapshot.items()):
+            cumulative = 0
+            for le, n in zip(LATENCY_BUCKETS, s.buckets):
+                cumulative += n
+                lines.append(f'sport_http_request_duration_seconds_bucket{{endpoint="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'sport_http_request_duration_seconds_bucket{{endpoint="{name}",le="+Inf"}} {s.count}')
+            lines.append(f'sport_http_request_duration_seconds_sum{{endpoint="{name}"}} {s.seconds:.6f}')
+            lines.append(f'sport_http_request_duration_seconds_count{{endpoint="{name}"}} {s.count}')
+
+        for metric, attr, help_text in (
+            ("sport_sql_statements_total", "sql_count", "Statement SQL eseguiti dalle richieste."),
+            ("sport_sql_duration_seconds_total", "sql_seconds", "Tempo passato negli statement SQL."),
+            ("sport_sql_rows_affected_total", "rows", "Righe inserite/modificate/cancellate (rowcount DML); le righe lette dalle SELECT non sono contate."),
+        ):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            for name, s in sorted(snapshot.items()):
+                value = getattr(s, attr)
+                lines.append(f'{metric}{{endpoint="{name}"}} {value:.6f}' if isinstance(value, float)
+                             else f'{metric}{{endpoint="{name}"}} {value}')
+
+        for collector in self._collectors:
+            lines += collector()
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
@@ -0,0 +1,105 @@
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from app import db
+
+# Migrazioni di schema versionate. db.create_all() crea solo le tabelle che
+# mancano e non tocca quelle esistenti: le modifiche a tabelle già in
+# produzione (SQLite o PostgreSQL) vanno aggiunte qui, in ordine, con un
+# numero di versione crescente. La versione applicata è in schema_migrations.
+# Ogni migrazione deve essere idempotente (IF NOT EXISTS ...), perché su un DB
+# nuovo create_all() ha già creato tutto quello che c'è nei modelli.
+
+
+def _m1_booking_indexes(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_prenotazioni_data_slot ON prenotazioni (data, slot_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_prenotazioni_user_data ON prenotazioni (user_id, data)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_slots_attivo_giorno ON slots (attivo, giorno_settimana)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_email_lower ON users (lower(email))"))
+
+
+def _m2_occupancy_index(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_slot_occupancy_data ON slot_occupancy (data, slot_id, prenotati)"))
+
+
+def _m3_booking_series(conn):
+    # nuova tabella (create_all la crea già su DB nuovi) + colonna su prenotazioni;
+    # SQLite non ha ADD COLUMN IF NOT EXISTS: si controlla prima
+    from app.models import SeriePrenotazione
+    SeriePrenotazione.__table__.create(conn, checkfirst=True)
+    columns = {c["name"] for c in inspect(conn).get_columns("prenotazioni")}
+    if "serie_id" not in columns:
+        conn.execute(text("ALTER TABLE prenotazioni ADD COLUMN serie_id INTEGER REFERENCES prenotazioni_serie (id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_prenotazioni_serie ON prenotazioni (serie_id)"))
+
+
+def _m4_cache_events(conn):
+    from app.models import CacheEvent
+    CacheEvent.__table__.create(conn, checkfirst=True)
+
+
+def _m5_slot_times(conn):
+    # orari a due cifre ("9:00" -> "09:00"): l'ordinamento per stringa deve
+    # coincidere con quello per minuti (storico con cursore keyset)
+    from app.schedule import normalize_time
+    rows = conn.execute(text("SELECT id, ora_inizio, ora_fine FROM slots")).all()
+    for slot_id, ora_inizio, ora_fine in rows:
+        fixed = normalize_time(ora_inizio), normalize_time(ora_fine)
+        if fixed != (ora_inizio, ora_fine):
+            conn.execute(text("UPDATE slots SET ora_inizio = :i, ora_fine = :f WHERE id = :id"),
+                         {"i": fixed[0], "f": fixed[1], "id": slot_id})
+
+
+def _m6_archive_series(conn):
+    # l'archivio conserva serie_id come prenotazioni (stesse colonne)
+    columns = {c["name"] for c in inspect(conn).get_columns("prenotazioni_archive")}
+    if "serie_id" not in columns:
+        conn.execute(text("ALTER TABLE prenotazioni_archive ADD COLUMN serie_id INTEGER REFERENCES prenotazioni_serie (id)"))
+
+
+MIGRATIONS = [
+    (1, "indici composti per prenotazioni/slot e login case-insensitive", _m1_booking_indexes),
+    (2, "indice per data sul rollup slot_occupancy (statistiche admin)", _m2_occupancy_index),
+    (3, "prenotazioni ricorrenti: tabella prenotazioni_serie e prenotazioni.serie_id", _m3_booking_series),
+    (4, "tabella cache_events per il bus di invalidazione tra worker", _m4_cache_events),
+    (5, "orari degli slot normalizzati a HH:MM con due cifre", _m5_slot_times),
+    (6, "prenotazioni_archive.serie_id (prenotazioni ricorrenti archiviate)", _m6_archive_series),
+]
+
+
+def _ensure_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        " version INTEGER PRIMARY KEY,"
+        " descrizione VARCHAR(200) NOT NULL,"
+        " applicata_il TIMESTAMP NOT NULL)"
+    ))
+
+
+def current_version():
+    with db.engine.begin() as conn:
+        _ensure_table(conn)
+        return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")).scalar()
+
+
+def pending():
+    version = current_version()
+    return [(v, desc) for v, desc, _ in MIGRATIONS if v > version]
+
+
+def upgrade():
+    # applica le migrazioni mancanti, ognuna nella sua transazione
+    applied = []
+    version = current_version()
+    for v, desc, fn in MIGRATIONS:
+        if v <= version:
+            continue
+        with db.engine.begin() as conn:
+            fn(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, descrizione, applicata_il) VALUES (:v, :d, :t)"),
+                {"v": v, "d": desc, "t": datetime.utcnow()},
+            )
+        applied.append((v, desc))
+    return applied
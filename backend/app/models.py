@@ -1,3 +1,4 @@
+import json
 from datetime import datetime
 from app import db
 
@@ -13,6 +14,11 @@ class User(db.Model):
     email = db.Column(db.String(160), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
 
+    # login case-insensitive: func.lower(User.email) == ...
+    __table_args__ = (
+        db.Index("ix_users_email_lower", db.func.lower(email)),
+    )
+
     def to_safe_dict(self):
         return {
             "id": self.id,
@@ -36,6 +42,11 @@ class Slot(db.Model):
     capienza = db.Column(db.Integer, nullable=True)  # None = illimitata
     attivo = db.Column(db.Boolean, nullable=False, default=True)
 
+    # GET /slots: attivo + giorno_settimana
+    __table_args__ = (
+        db.Index("ix_slots_attivo_giorno", "attivo", "giorno_settimana"),
+    )
+
     def is_unlimited(self):
         return self.capienza is None
 
@@ -59,12 +70,119 @@ class Prenotazione(db.Model):
     slot_id = db.Column(db.Integer, db.ForeignKey("slots.id"), nullable=False)
     data = db.Column(db.Date, nullable=False)
     timestamp_creazione = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # prenotazione creata da una serie settimanale (None = prenotazione singola)
+    serie_id = db.Column(db.Integer, db.ForeignKey("prenotazioni_serie.id"), nullable=True)
 
     user = db.relationship("User", backref="prenotazioni")
     slot = db.relationship("Slot", backref="prenotazioni")
 
-    # Un utente non può prenotare due volte lo stesso slot nella stessa data
+    # Un utente non può prenotare due volte lo stesso slot nella stessa data.
+    # Indici: (data, slot_id) per i conteggi per data e per (slot, data) di book()
+    # e degli statini; (user_id, data) per le prenotazioni di un utente.
+    # Gli indici su DB esistenti si aggiungono con migrate.py (app.migrations).
     __table_args__ = (
         db.UniqueConstraint("user_id", "slot_id", "data", name="uq_user_slot_date"),
+        db.Index("ix_prenotazioni_data_slot", "data", "slot_id"),
+        db.Index("ix_prenotazioni_user_data", "user_id", "data"),
+        db.Index("ix_prenotazioni_serie", "serie_id"),
+    )
+
+class SeriePrenotazione(db.Model):
+    # Prenotazione ricorrente: stesso slot ogni settimana da data_inizio a
+    # data_fine (app.booking.book_series). Le singole date sono righe di
+    # prenotazioni con serie_id; attiva=False dopo la cancellazione della serie.
+    __tablename__ = "prenotazioni_serie"
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    slot_id = db.Column(db.Integer, db.ForeignKey("slots.id"), nullable=False)
+    data_inizio = db.Column(db.Date, nullable=False)
+    data_fine = db.Column(db.Date, nullable=False)
+    attiva = db.Column(db.Boolean, nullable=False, default=True)
+    timestamp_creazione = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_prenotazioni_serie_user", "user_id"),
+    )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "slot_id": self.slot_id,
+            "data_inizio": self.data_inizio.isoformat(),
+            "data_fine": self.data_fine.isoformat(),
+            "attiva": self.attiva,
+        }
+
+class PrenotazioneArchivio(db.Model):
+    # Prenotazioni passate spostate da app.archive: stesse colonne (e stessi id)
+    # di prenotazioni, che così resta piccola. Export e report le leggono con
+    # archive.bookings_source() quando il periodo arriva all'archivio.
+    __tablename__ = "prenotazioni_archive"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    slot_id = db.Column(db.Integer, db.ForeignKey("slots.id"), nullable=False)
+    data = db.Column(db.Date, nullable=False)
+    timestamp_creazione = db.Column(db.DateTime, nullable=False)
+    serie_id = db.Column(db.Integer, db.ForeignKey("prenotazioni_serie.id"), nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_prenotazioni_archive_data_slot", "data", "slot_id"),
+        db.Index("ix_prenotazioni_archive_user_data", "user_id", "data"),
+    )
+
+class SlotOccupancy(db.Model):
+    # Contatore prenotazioni per (slot, data): aggiornato con UPDATE condizionato
+    # da app.booking, così il controllo capienza + incremento è atomico.
+    __tablename__ = "slot_occupancy"
+
+    slot_id = db.Column(db.Integer, db.ForeignKey("slots.id"), primary_key=True)
+    data = db.Column(db.Date, primary_key=True)
+    prenotati = db.Column(db.Integer, nullable=False, default=0)
+
+    # statistiche per periodo (app.stats): range sulla data
+    __table_args__ = (
+        db.Index("ix_slot_occupancy_data", "data", "slot_id", "prenotati"),
     )
 
+class ReportJob(db.Model):
+    # Report admin pesanti (xlsx/zip) generati in background da app.reports
+    __tablename__ = "report_jobs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(40), nullable=False)
+    parametri = db.Column(db.Text, nullable=False, default="{}")  # JSON
+    stato = db.Column(db.String(10), nullable=False, default="QUEUED")  # QUEUED/RUNNING/DONE/ERROR
+    file_path = db.Column(db.String(255), nullable=True)
+    errore = db.Column(db.Text, nullable=True)
+    creato_da = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=True)
+    timestamp_creazione = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    timestamp_fine = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "tipo": self.tipo,
+            "parametri": json.loads(self.parametri or "{}"),
+            "stato": self.stato,
+            "errore": self.errore,
+            "timestamp_creazione": self.timestamp_creazione.isoformat() if self.timestamp_creazione else None,
+            "timestamp_fine": self.timestamp_fine.isoformat() if self.timestamp_fine else None,
+        }
+
+class CacheEvent(db.Model):
+    # Bus di invalidazione tra worker (app.bus, BUS_TRANSPORT=table): ogni
+    # worker scrive qui le modifiche fatte e legge quelle degli altri con id
+    # maggiore dell'ultimo visto. Le righe più vecchie di BUS_RETENTION si cancellano.
+    __tablename__ = "cache_events"
+
+    id = db.Column(db.Integer, primary_key=True)
+    origin = db.Column(db.String(32), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default="{}")  # JSON
+    timestamp_creazione = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_cache_events_timestamp", "timestamp_creazione"),
+    )
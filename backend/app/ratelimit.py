@@ -0,0 +1,105 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import jsonify, request
+
+# Limite di richieste per utente (e per IP sul login) a token bucket, per
+# worker: ogni chiave ha un secchio di "burst" gettoni che si ricarica a "rate"
+# gettoni al secondo; una richiesta ne consuma uno, a secchio vuoto 429 con
+# Retry-After. Classi separate: read (GET), write (il resto), login (per IP).
+# Le chiavi inattive escono in ordine LRU oltre RATE_LIMIT_KEYS: una chiave
+# rimossa riparte col secchio pieno, come se fosse rimasta ferma a lungo.
+
+KINDS = ("read", "write", "login")
+
+
+def parse_rate(value):
+    # "rate:burst" in richieste/secondo, es. "10:30"; "0" o "" = nessun limite
+    value = (value or "").strip()
+    if value in ("", "0"):
+        return None
+    rate, _, burst = value.partition(":")
+    rate = float(rate)
+    burst = float(burst or max(rate, 1))
+    if rate <= 0 or burst < 1:
+        raise ValueError(f"Invalid rate {value!r} (rate:burst, burst >= 1)")
+    return rate, burst
+
+
+class RateLimiter:
+    def __init__(self, maxsize=10000):
+        self.enabled = False
+        self.maxsize = maxsize
+        self.proxies = 0
+        self.rates = dict.fromkeys(KINDS)  # kind -> (rate, burst) oppure None
+        self._buckets = OrderedDict()  # (kind, chiave) -> [gettoni, ultimo aggiornamento]
+        self._allowed = dict.fromkeys(KINDS, 0)
+        self._throttled = dict.fromkeys(KINDS, 0)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config.get("RATE_LIMIT_ENABLED", False)
+        self.maxsize = int(app.config.get("RATE_LIMIT_KEYS", self.maxsize))
+        self.proxies = int(app.config.get("RATE_LIMIT_PROXIES", self.proxies))
+        for kind in KINDS:
+            self.rates[kind] = parse_rate(app.config.get(f"RATE_LIMIT_{kind.upper()}"))
+        with self._lock:
+            self._buckets.clear()
+
+    def take(self, kind, key):
+        # 0 se la richiesta passa, altrimenti i secondi da aspettare
+        limit = self.rates[kind] if self.enabled else None
+        if limit is None:
+            return 0
+        rate, burst = limit
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get((kind, key))
+            if bucket is None:
+                bucket = self._buckets[(kind, key)] = [burst, now]
+                if len(self._buckets) > self.maxsize:
+                    self._buckets.popitem(last=False)
+            else:
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+                self._buckets.move_to_end((kind, key))
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                self._allowed[kind] += 1
+                return 0
+            self._throttled[kind] += 1
+            return (1 - bucket[0]) / rate
+
+    def client_ip(self):
+        # dietro N proxy fidati (RATE_LIMIT_PROXIES) l'IP del client è l'N-esimo
+        # da destra in X-Forwarded-For; quelli più a sinistra li scrive il client
+        if self.proxies > 0:
+            forwarded = [ip.strip() for ip in request.headers.get("X-Forwarded-For", "").split(",") if ip.strip()]
+            if len(forwarded) >= self.proxies:
+                return forwarded[-self.proxies]
+        return request.remote_addr
+
+    def check(self, kind, key):
+        # None oppure la risposta 429 da restituire
+        wait = self.take(kind, key)
+        if not wait:
+            return None
+        return jsonify({"error": "Too many requests"}), 429, {"Retry-After": str(math.ceil(wait))}
+
+    def metrics_lines(self):
+        with self._lock:
+            allowed, throttled, keys = dict(self._allowed), dict(self._throttled), len(self._buckets)
+        lines = ["# TYPE sport_ratelimit_requests_total counter"]
+        for kind in KINDS:
+            if self.rates[kind] is None:
+                continue
+            lines.append(f'sport_ratelimit_requests_total{{kind="{kind}",result="allowed"}} {allowed[kind]}')
+            lines.append(f'sport_ratelimit_requests_total{{kind="{kind}",result="throttled"}} {throttled[kind]}')
+        lines += ["# TYPE sport_ratelimit_keys gauge", f"sport_ratelimit_keys {keys}"]
+        return lines
+
+
+rate_limiter = RateLimiter()
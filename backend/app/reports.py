@@ -0,0 +1,192 @@
+import calendar
+import csv
+import hashlib
+import io
+import json
+import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import groupby
+
+from flask import current_app
+from sqlalchemy import func
+
+from app import db
+from app.archive import bookings_source
+from app.exports import bookings_query
+from app.models import Slot, ReportJob
+
+# Report admin generati fuori dal worker HTTP: il job è salvato su DB
+# (report_jobs), il file su disco in REPORTS_DIR con nome = hash di
+# (tipo, parametri, versione dei dati), così una richiesta identica su dati
+# invariati viene servita subito dal file già pronto.
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _parse_day(value, field):
+    try:
+        return datetime.strptime(str(value), "%Y-%m-%d").date()
+    except ValueError:
+        raise ValueError(f"Invalid {field}")
+
+
+def _month_range(params):
+    try:
+        first = datetime.strptime(str(params.get("month", "")), "%Y-%m").date()
+    except ValueError:
+        raise ValueError("Invalid month (YYYY-MM)")
+    last = first.replace(day=calendar.monthrange(first.year, first.month)[1])
+    return first, last
+
+
+def _range(params):
+    d_from = _parse_day(params.get("from"), "from")
+    d_to = _parse_day(params.get("to"), "to")
+    if d_to < d_from:
+        raise ValueError("Invalid range")
+    return d_from, d_to
+
+
+def _days(d_from, d_to):
+    d = d_from
+    while d <= d_to:
+        yield d
+        d += timedelta(days=1)
+
+
+def build_occupancy_workbook(params, path):
+    # un foglio per impianto: occupazione di ogni turno in ogni giorno del mese
+    from openpyxl import Workbook
+
+    d_from, d_to = _month_range(params)
+    slots = Slot.query.order_by(Slot.impianto.asc(), Slot.giorno_settimana.asc(), Slot.ora_inizio.asc()).all()
+    p = bookings_source(d_from, d_to)
+    counts = {
+        (slot_id, d): n
+        for slot_id, d, n in db.session.query(p.c.slot_id, p.c.data, func.count(p.c.id))
+        .filter(p.c.data >= d_from, p.c.data <= d_to)
+        .group_by(p.c.slot_id, p.c.data)
+    }
+
+    wb = Workbook(write_only=True)
+    for impianto, group in groupby(slots, key=lambda s: s.impianto):
+        group = list(group)
+        ws = wb.create_sheet(title=impianto[:31])
+        ws.append(["Data", "Turno", "Ora inizio", "Ora fine", "Capienza", "Prenotati", "Occupazione %"])
+        for d in _days(d_from, d_to):
+            for s in group:
+                if s.giorno_settimana != d.weekday() + 1:
+                    continue
+                booked = counts.get((s.id, d), 0)
+                perc = round(booked * 100 / s.capienza, 1) if s.capienza else None
+                ws.append([d, s.titolo, s.ora_inizio, s.ora_fine, s.capienza, booked, perc])
+    if not slots:
+        wb.create_sheet(title="Vuoto")
+    wb.save(path)
+
+
+def build_statini_zip(params, path):
+    # un CSV (stesso formato di /admin/export) per ogni slot/data del periodo
+    d_from, d_to = _range(params)
+    impianto = (params.get("impianto") or "").strip().upper() or None
+    rows = bookings_query(d_from, d_to, impianto=impianto).yield_per(500)
+
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for (d, imp, titolo, ora_inizio, ora_fine), people in groupby(rows, key=lambda r: tuple(r[:5])):
+            output = io.StringIO()
+            writer = csv.writer(output)
+            writer.writerow(["Cognome", "Nome", "Gruppo", "Email/Username"])
+            for r in people:
+                writer.writerow(r[5:])
+            name = f"statino_{imp}_{d.isoformat()}_{ora_inizio}-{ora_fine}.csv".replace(":", "-")
+            zf.writestr(name, output.getvalue())
+
+
+REPORT_TYPES = {
+    # tipo -> (builder, estensione, periodo dai parametri)
+    "occupancy_month": (build_occupancy_workbook, "xlsx", _month_range),
+    "statini_zip": (build_statini_zip, "zip", _range),
+}
+
+
+def data_version(d_from, d_to):
+    # cambia se cambiano le prenotazioni del periodo o la configurazione degli slot
+    p = bookings_source(d_from, d_to)
+    n, max_id, max_ts = (
+        db.session.query(func.count(p.c.id), func.max(p.c.id), func.max(p.c.timestamp_creazione))
+        .filter(p.c.data >= d_from, p.c.data <= d_to)
+        .one()
+    )
+    slots = hashlib.sha256(
+        json.dumps([s.to_dict() for s in Slot.query.order_by(Slot.id).all()], sort_keys=True).encode()
+    ).hexdigest()
+    return f"{n}:{max_id}:{max_ts}:{slots}"
+
+
+def cache_path(tipo, params):
+    _, ext, period = REPORT_TYPES[tipo]
+    key = json.dumps([tipo, params, data_version(*period(params))], sort_keys=True, default=str)
+    digest = hashlib.sha256(key.encode()).hexdigest()[:32]
+    return os.path.join(current_app.config["REPORTS_DIR"], f"{tipo}_{digest}.{ext}")
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=current_app.config.get("REPORT_WORKERS", 1))
+        return _executor
+
+
+def enqueue(tipo, params, user_id=None):
+    if tipo not in REPORT_TYPES:
+        raise ValueError("Unknown report type")
+    if not isinstance(params, dict):
+        raise ValueError("Invalid parametri")
+    REPORT_TYPES[tipo][2](params)  # valida i parametri prima di accodare
+
+    job = ReportJob(tipo=tipo, parametri=json.dumps(params, sort_keys=True), stato="QUEUED", creato_da=user_id)
+    path = cache_path(tipo, params)
+    if os.path.exists(path):
+        job.stato = "DONE"
+        job.file_path = path
+        job.timestamp_fine = datetime.utcnow()
+    db.session.add(job)
+    db.session.commit()
+
+    if job.stato == "QUEUED":
+        _get_executor().submit(_run_job, current_app._get_current_object(), job.id)
+    return job
+
+
+def _run_job(app, job_id):
+    with app.app_context():
+        job = db.session.get(ReportJob, job_id)
+        job.stato = "RUNNING"
+        db.session.commit()
+
+        params = json.loads(job.parametri)
+        tmp = None
+        try:
+            builder = REPORT_TYPES[job.tipo][0]
+            path = cache_path(job.tipo, params)  # versione dei dati al momento della generazione
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f"{path}.{job_id}.tmp"
+                builder(params, tmp)
+                os.replace(tmp, path)
+            job.file_path = path
+            job.stato = "DONE"
+        except Exception as e:
+            if tmp and os.path.exists(tmp):
+                os.remove(tmp)
+            db.session.rollback()
+            job = db.session.get(ReportJob, job_id)
+            job.stato = "ERROR"
+            job.errore = str(e)
+        job.timestamp_fine = datetime.utcnow()
+        db.session.commit()
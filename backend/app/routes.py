@@ -1,17 +1,38 @@
-from datetime import datetime
+from datetime import datetime, date, timedelta
+import base64
 import csv
 import io
+import json
+import os
 
-from flask import Blueprint, jsonify, request, Response
-from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import func
+from flask import Blueprint, jsonify, request, Response, stream_with_context, send_file
+from sqlalchemy import func, tuple_
 
 from app import db
-from app.models import User, Slot, Prenotazione
-from app.auth import create_token, require_auth, require_admin
+from app.models import User, Slot, Prenotazione, ReportJob, SeriePrenotazione
+from app.auth import create_token, require_auth, require_admin, user_cache
+from app.security import password_hasher, PasswordBusy
+from app.availability import availability_cache
+from app import booking
+from app.exports import bookings_query, iter_csv
+from app.events import publisher, format_sse, RESET
+from app import reports
+from app import stats
+from app import archive
+from app.admission import admission_queue, AdmissionFull
+from app.metrics import metrics
+from app.ratelimit import rate_limiter
+from app.bus import bus
+from app.schedule import normalize_time, schedule, to_minutes
 
 bp = Blueprint("api", __name__)
 
+MAX_RANGE_DAYS = 31
+MAX_BATCH_OPS = 50
+MAX_PAGE_SIZE = 200
+MAX_SERIES_WEEKS = 26
+UNKNOWN = object()
+
 def parse_date(date_str: str):
     return datetime.strptime(date_str, "%Y-%m-%d").date()
 
@@ -19,8 +40,122 @@ def weekday_1_to_7(d):
     # python: Monday=0..Sunday=6
     return d.weekday() + 1
 
+def slot_availability(s, booked, my_booked):
+    # s = Slot.to_dict(); aggiunge posti occupati/rimasti per la data
+    booked = int(booked)
+    if s["capienza"] is None:
+        rimasti = None
+        pieno = False
+    else:
+        rimasti = max(s["capienza"] - booked, 0)
+        pieno = booked >= s["capienza"]
+
+    return {
+        **s,
+        "prenotati": booked,
+        "rimasti": rimasti,  # None = illimitati
+        "pieno": pieno,
+        "prenotato_da_me": (s["id"] in my_booked),
+    }
+
+def booking_changed(d, slot_id, prenotati, delta, capienza=UNKNOWN):
+    # dopo il commit di una prenotazione/cancellazione: cache + stream SSE,
+    # e gli altri worker tramite il bus di invalidazione
+    if prenotati is None:
+        availability_cache.apply_delta(d, slot_id, delta)
+    else:
+        availability_cache.set_count(d, slot_id, prenotati)
+    bus.publish("booking", date=d.isoformat(), slot_id=slot_id, prenotati=prenotati)
+    notify_streams(d, slot_id, prenotati, capienza)
+
+def notify_streams(d, slot_id, prenotati, capienza=UNKNOWN):
+    # sempre nel buffer, anche senza stream aperti: un client che si riconnette
+    # con Last-Event-ID deve ricevere la variazione (o un reset)
+    if prenotati is None:
+        if not publisher.has_subscribers(d):
+            # nessuno in ascolto: niente count(), basta un reset per chi riprende
+            publisher.publish_reset(d)
+            return
+        prenotati = db.session.query(func.count(Prenotazione.id)).filter(
+            Prenotazione.slot_id == slot_id, Prenotazione.data == d
+        ).scalar() or 0
+    if capienza is UNKNOWN:
+        capienza = schedule.get(slot_id).capienza
+    publisher.publish(d, slot_id, prenotati, capienza)
+
+@bus.handler("booking")
+def _remote_booking(payload):
+    # prenotazione fatta da un altro worker: i conteggi in cache di quella data
+    # si rileggono dal DB (l'ordine dei messaggi tra worker non è garantito,
+    # quindi niente patch con il valore ricevuto); gli stream SSE lo ricevono
+    d = parse_date(payload["date"])
+    availability_cache.drop_date(d)
+    notify_streams(d, payload["slot_id"], payload["prenotati"])
+
+@bus.handler("slots")
+def _remote_slots(payload):
+    schedule.invalidate()
+    availability_cache.clear()
+
+@bus.handler("user")
+def _remote_user(payload):
+    if payload.get("user_id") is None:
+        user_cache.clear()
+    else:
+        user_cache.invalidate(payload["user_id"])
+
+@bus.handler("reset")
+def _bus_reset(payload):
+    schedule.invalidate()
+    availability_cache.clear()
+    user_cache.clear()
+
+def check_slot_times(impianto, giorno_settimana, ora_inizio, ora_fine, attivo, exclude_id=None):
+    # admin: orari validi e nessuna sovrapposizione con altri slot attivi dello stesso impianto
+    try:
+        inizio, fine = to_minutes(ora_inizio), to_minutes(ora_fine)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if inizio >= fine:
+        return jsonify({"error": "ora_fine must be after ora_inizio"}), 400
+    if giorno_settimana not in range(1, 8):
+        return jsonify({"error": "Invalid giorno_settimana (1-7)"}), 400
+    if not attivo:
+        return None
+
+    conflicts = schedule.overlaps(impianto, giorno_settimana, inizio, fine, exclude_id=exclude_id)
+    if conflicts:
+        return jsonify({"error": "Overlapping slot", "slots": [c.data for c in conflicts]}), 409
+    return None
+
+def not_modified(etag):
+    # If-None-Match uguale: 304 senza ricostruire la risposta
+    if etag in request.if_none_match:
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "private, no-cache"
+        return resp
+    return None
+
+def slots_etag(d, date_str, impianto, user_id, my_booked):
+    # la risposta dipende anche dall'utente (prenotato_da_me): le sue prenotazioni
+    # della data sono nel tag, così una prenotazione fatta su un altro worker
+    # (le versioni della cache sono per-worker) non viene nascosta da un 304
+    mine = "-".join(str(slot_id) for slot_id in sorted(my_booked)) or "0"
+    return f"slots.{availability_cache.version_tag(d)}.{date_str}.{impianto}.{user_id}.{mine}"
+
+def with_etag(resp, etag):
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
 @bp.post("/auth/login")
 def login():
+    # prima dell'hash della password: è la parte costosa da proteggere
+    limited = rate_limiter.check("login", rate_limiter.client_ip())
+    if limited:
+        return limited
+
     data = request.get_json(force=True)
     identifier = (data.get("email") or data.get("username") or "").strip().lower()
     password = (data.get("password") or "").strip()
@@ -32,9 +167,21 @@ def login():
     if not user:
         return jsonify({"error": "Invalid credentials"}), 401
 
-    if not check_password_hash(user.password_hash, password):
+    try:
+        ok = password_hasher.check(password, user.password_hash)
+    except PasswordBusy:
+        return jsonify({"error": "Too many logins, retry"}), 503, {"Retry-After": "2"}
+    if not ok:
         return jsonify({"error": "Invalid credentials"}), 401
 
+    # parametri di hashing cambiati: aggiorno l'hash ora che ho la password in chiaro
+    if password_hasher.needs_rehash(user.password_hash):
+        try:
+            user.password_hash = password_hasher.hash(password)
+            db.session.commit()
+        except PasswordBusy:
+            pass  # riproverà al prossimo login
+
     token = create_token(user)
     return jsonify({"token": token, "user": user.to_safe_dict()})
 
@@ -44,7 +191,7 @@ def me():
     return jsonify({"user": request.user.to_safe_dict()})
 
 @bp.get("/slots")
-@require_auth
+@require_auth(trust_claims=True)
 def get_slots_for_date():
     date_str = request.args.get("date", "").strip()
     impianto = (request.args.get("impianto") or "").strip().upper()
@@ -53,48 +200,116 @@ def get_slots_for_date():
         return jsonify({"error": "Missing date"}), 400
 
     d = parse_date(date_str)
-    dow = weekday_1_to_7(d)
-
-    q = Slot.query.filter_by(attivo=True, giorno_settimana=dow)
-    if impianto:
-        q = q.filter(Slot.impianto == impianto)
 
-    slots = q.order_by(Slot.ora_inizio.asc()).all()
-
-    # prenotazioni per slot in quella data
-    counts = dict(
-        db.session.query(Prenotazione.slot_id, func.count(Prenotazione.id))
-        .filter(Prenotazione.data == d)
-        .group_by(Prenotazione.slot_id)
+    # prenotazioni dell'utente in quella data (per mostrare "Prenotato"): sempre
+    # dal DB, anche per il 304 (lookup su ix_prenotazioni_user_data)
+    my_booked = set(
+        r[0] for r in db.session.query(Prenotazione.slot_id)
+        .filter(Prenotazione.data == d, Prenotazione.user_id == request.user.id)
         .all()
     )
 
-    # prenotazioni dell'utente in quella data (per mostrare "Prenotato")
+    etag = slots_etag(d, date_str, impianto, request.user.id, my_booked)
+    cached_resp = not_modified(etag)
+    if cached_resp:
+        return cached_resp
+
+    cached = availability_cache.get(d, impianto)
+    if cached is not None:
+        slots, counts = cached
+    else:
+        version = availability_cache.version(d)
+        slots = [s.data for s in schedule.for_date(d, impianto)]
+
+        # prenotazioni per slot in quella data
+        counts = dict(
+            db.session.query(Prenotazione.slot_id, func.count(Prenotazione.id))
+            .filter(Prenotazione.data == d)
+            .group_by(Prenotazione.slot_id)
+            .all()
+        )
+        availability_cache.put(d, impianto, slots, counts, version)
+
+    result = [slot_availability(s, counts.get(s["id"], 0), my_booked) for s in slots]
+    return with_etag(jsonify({"date": date_str, "slots": result}), etag)
+
+@bp.get("/slots/range")
+@require_auth(trust_claims=True)
+def get_slots_for_range():
+    # disponibilità di più giorni (es. settimana) con un numero fisso di query
+    from_str = (request.args.get("from") or "").strip()
+    to_str = (request.args.get("to") or "").strip()
+    impianto = (request.args.get("impianto") or "").strip().upper()
+
+    if not from_str or not to_str:
+        return jsonify({"error": "Missing from/to"}), 400
+
+    d_from = parse_date(from_str)
+    d_to = parse_date(to_str)
+    n_days = (d_to - d_from).days + 1
+    if n_days < 1 or n_days > MAX_RANGE_DAYS:
+        return jsonify({"error": f"Invalid range (max {MAX_RANGE_DAYS} days)"}), 400
+
+    days = [d_from + timedelta(days=i) for i in range(n_days)]
+
+    by_dow = {dow: [s.data for s in schedule.for_weekday(dow, impianto)] for dow in {weekday_1_to_7(d) for d in days}}
+
+    counts = {
+        (slot_id, d): n
+        for slot_id, d, n in db.session.query(Prenotazione.slot_id, Prenotazione.data, func.count(Prenotazione.id))
+        .filter(Prenotazione.data >= d_from, Prenotazione.data <= d_to)
+        .group_by(Prenotazione.slot_id, Prenotazione.data)
+    }
+
     my_booked = set(
-        r[0] for r in db.session.query(Prenotazione.slot_id)
-        .filter(Prenotazione.data == d, Prenotazione.user_id == request.user.id)
+        db.session.query(Prenotazione.slot_id, Prenotazione.data)
+        .filter(Prenotazione.user_id == request.user.id, Prenotazione.data >= d_from, Prenotazione.data <= d_to)
         .all()
     )
 
     result = []
-    for s in slots:
-        booked = int(counts.get(s.id, 0))
-        if s.capienza is None:
-            rimasti = None
-            pieno = False
-        else:
-            rimasti = max(s.capienza - booked, 0)
-            pieno = booked >= s.capienza
-
+    for d in days:
+        mine = {slot_id for slot_id, day in my_booked if day == d}
         result.append({
-            **s.to_dict(),
-            "prenotati": booked,
-            "rimasti": rimasti,  # None = illimitati
-            "pieno": pieno,
-            "prenotato_da_me": (s.id in my_booked),
+            "date": d.isoformat(),
+            "slots": [slot_availability(s, counts.get((s["id"], d), 0), mine) for s in by_dow.get(weekday_1_to_7(d), [])],
         })
 
-    return jsonify({"date": date_str, "slots": result})
+    return jsonify({"from": from_str, "to": to_str, "days": result})
+
+@bp.get("/slots/stream")
+@require_auth(trust_claims=True, allow_query_token=True)
+def stream_slots():
+    # Server-Sent Events: variazioni di disponibilità per la data.
+    # EventSource non può mandare header: token anche in ?access_token=
+    date_str = request.args.get("date", "").strip()
+    if not date_str:
+        return jsonify({"error": "Missing date"}), 400
+
+    d = parse_date(date_str)
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    if not publisher.open_stream(d):
+        return jsonify({"error": "Too many streams"}), 503, {"Retry-After": "10"}
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            for events in publisher.subscribe(d, last_event_id):
+                if events is RESET:
+                    yield format_sse("reset", {"date": date_str})
+                    continue
+                if not events:
+                    yield ": ping\n\n"  # heartbeat
+                for n, payload in events:
+                    yield format_sse("slot", payload, publisher.event_id(n))
+        finally:
+            publisher.close_stream(d)
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @bp.post("/bookings")
 @require_auth
@@ -107,7 +322,7 @@ def book():
         return jsonify({"error": "Missing slot_id/date"}), 400
 
     d = parse_date(date_str)
-    slot = db.session.get(Slot, int(slot_id))
+    slot = schedule.get(int(slot_id))
     if not slot or not slot.attivo:
         return jsonify({"error": "Slot not found/inactive"}), 404
 
@@ -115,30 +330,50 @@ def book():
     if slot.giorno_settimana != weekday_1_to_7(d):
         return jsonify({"error": "Slot not available on this date"}), 400
 
-    # già prenotato da me?
-    existing = Prenotazione.query.filter_by(
-        user_id=request.user.id,
-        slot_id=slot.id,
-        data=d
-    ).first()
-    if existing:
-        return jsonify({"error": "Already booked"}), 409
-
-    # capienza?
-    if slot.capienza is not None:
-        booked = db.session.query(func.count(Prenotazione.id)).filter(
-            Prenotazione.slot_id == slot.id,
-            Prenotazione.data == d
-        ).scalar() or 0
-
-        if booked >= slot.capienza:
-            return jsonify({"error": "Full"}), 409
+    if admission_queue.enabled and slot.capienza is not None:
+        # coda di ammissione: FIFO per (slot, data), un solo committer
+        try:
+            ticket = admission_queue.submit(request.user.id, slot, d)
+        except AdmissionFull:
+            return jsonify({"error": "Too many pending bookings, retry"}), 503, {"Retry-After": "2"}
+        # restituisco la connessione prima di aspettare: su SQLite una lettura
+        # aperta impedirebbe al committer di scrivere
+        db.session.close()
+        ticket.done.wait(admission_queue.wait)
+        return ticket_response(ticket)
+
+    capienza = slot.capienza
+    try:
+        _, prenotati = booking.book(request.user.id, slot, d)
+    except booking.BookingError as e:
+        return jsonify({"error": e.message}), e.status
+
+    booking_changed(d, int(slot_id), prenotati, +1, capienza)
+    return jsonify({"ok": True})
 
-    b = Prenotazione(user_id=request.user.id, slot_id=slot.id, data=d)
-    db.session.add(b)
-    db.session.commit()
+def ticket_response(ticket):
+    if not ticket.done.is_set():
+        return jsonify({"ticket": ticket.id, "position": admission_queue.position(ticket)}), 202
+    if ticket.error:
+        return jsonify({"error": ticket.error}), ticket.status
     return jsonify({"ok": True})
 
+@bp.get("/bookings/tickets/<ticket_id>")
+@require_auth(trust_claims=True)
+def booking_ticket(ticket_id):
+    # esito di una prenotazione accodata (202 da POST /bookings); ?wait=secondi
+    ticket = admission_queue.get(ticket_id, request.user.id)
+    if not ticket:
+        return jsonify({"error": "Ticket not found"}), 404
+    try:
+        wait = min(max(float(request.args.get("wait", 0)), 0), admission_queue.wait)
+    except ValueError:
+        return jsonify({"error": "Invalid wait"}), 400
+    if wait:
+        db.session.close()
+        ticket.done.wait(wait)
+    return ticket_response(ticket)
+
 @bp.delete("/bookings")
 @require_auth
 def cancel_booking():
@@ -150,25 +385,253 @@ def cancel_booking():
         return jsonify({"error": "Missing slot_id/date"}), 400
 
     d = parse_date(date_str)
-    b = Prenotazione.query.filter_by(
-        user_id=request.user.id,
-        slot_id=int(slot_id),
-        data=d
-    ).first()
-    if not b:
+    try:
+        prenotati = booking.cancel(request.user.id, int(slot_id), d)
+    except booking.BookingError as e:
+        return jsonify({"error": e.message}), e.status
+
+    booking_changed(d, int(slot_id), prenotati, -1)
+    return jsonify({"ok": True})
+
+def encode_cursor(*values):
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    return json.loads(raw)
+
+@bp.get("/bookings/mine")
+@require_auth(trust_claims=True)
+def my_bookings():
+    # storico dell'utente con paginazione keyset su (data, ora_inizio, id):
+    # nessun OFFSET, ogni pagina è una range scan su ix_prenotazioni_user_data.
+    # scope=upcoming (da oggi, crescente) | past (prima di oggi, decrescente);
+    # date=YYYY-MM-DD limita a un giorno.
+    scope = (request.args.get("scope") or "upcoming").strip().lower()
+    date_str = (request.args.get("date") or "").strip()
+    cursor = (request.args.get("cursor") or "").strip()
+    try:
+        limit = min(max(int(request.args.get("limit", 50)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+    if scope not in ("upcoming", "past"):
+        return jsonify({"error": "Invalid scope"}), 400
+    descending = scope == "past" and not date_str
+
+    if date_str:
+        d_from = d_to = parse_date(date_str)
+    elif scope == "upcoming":
+        d_from, d_to = date.today(), None
+    else:
+        d_from, d_to = None, date.today() - timedelta(days=1)
+
+    # lo storico passato può essere già in prenotazioni_archive
+    p = archive.bookings_source(d_from, d_to, user_id=request.user.id)
+    key = (p.c.data, Slot.ora_inizio, p.c.id)
+    q = (
+        db.session.query(p.c.id, p.c.slot_id, p.c.data, p.c.timestamp_creazione,
+                         Slot.impianto, Slot.titolo, Slot.ora_inizio, Slot.ora_fine)
+        .select_from(p)
+        .join(Slot, Slot.id == p.c.slot_id)
+        .filter(p.c.user_id == request.user.id)
+    )
+    if d_from:
+        q = q.filter(p.c.data >= d_from)
+    if d_to:
+        q = q.filter(p.c.data <= d_to)
+
+    if cursor:
+        try:
+            c_data, c_ora, c_id = decode_cursor(cursor)
+            c_data, c_ora, c_id = parse_date(c_data), str(c_ora), int(c_id)
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid cursor"}), 400
+        # il filtro in più sulla sola data delimita la range scan sull'indice
+        if descending:
+            q = q.filter(p.c.data <= c_data, tuple_(*key) < tuple_(c_data, c_ora, c_id))
+        else:
+            q = q.filter(p.c.data >= c_data, tuple_(*key) > tuple_(c_data, c_ora, c_id))
+
+    order = [k.desc() for k in key] if descending else [k.asc() for k in key]
+    rows = q.order_by(*order).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.data.isoformat(), last.ora_inizio, last.id)
+
+    return jsonify({
+        "bookings": [{
+            "booking_id": r.id,
+            "slot_id": r.slot_id,
+            "date": r.data.isoformat(),
+            "impianto": r.impianto,
+            "titolo": r.titolo,
+            "ora_inizio": r.ora_inizio,
+            "ora_fine": r.ora_fine,
+            "timestamp_creazione": r.timestamp_creazione.isoformat(),
+        } for r in rows],
+        "next_cursor": next_cursor,
+    })
+
+@bp.delete("/bookings/<int:booking_id>")
+@require_auth
+def cancel_booking_by_id(booking_id):
+    # cancellazione con il booking_id restituito da /bookings/mine
+    p = db.session.get(Prenotazione, booking_id)
+    if not p or p.user_id != request.user.id:
         return jsonify({"error": "Not booked"}), 404
 
-    db.session.delete(b)
-    db.session.commit()
+    slot_id, d = p.slot_id, p.data
+    try:
+        prenotati = booking.cancel(request.user.id, slot_id, d)
+    except booking.BookingError as e:
+        return jsonify({"error": e.message}), e.status
+
+    booking_changed(d, slot_id, prenotati, -1)
     return jsonify({"ok": True})
 
+def _run_batch(default_op):
+    data = request.get_json(force=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Missing operations"}), 400
+    ops = data.get("operations") or []
+    mode = str(data.get("mode") or "atomic").strip().lower()
+
+    if not isinstance(ops, list) or not ops:
+        return jsonify({"error": "Missing operations"}), 400
+    if len(ops) > MAX_BATCH_OPS:
+        return jsonify({"error": f"Too many operations (max {MAX_BATCH_OPS})"}), 400
+    if mode not in ("atomic", "best_effort"):
+        return jsonify({"error": "Invalid mode"}), 400
+
+    items = []
+    for op in ops:
+        if not isinstance(op, dict):
+            items.append({"op": default_op or "book", "slot_id": None, "date": None,
+                          "error": "Invalid operation", "status": 400})
+            continue
+        it = {"op": default_op or op.get("op", "book"), "slot_id": op.get("slot_id"), "date": op.get("date")}
+        try:
+            if it["op"] not in ("book", "cancel"):
+                raise ValueError
+            it["slot_id"] = int(it["slot_id"])
+            it["data"] = parse_date(str(it["date"]).strip())
+        except (TypeError, ValueError):
+            it["error"] = "Invalid operation"
+            it["status"] = 400
+        items.append(it)
+
+    try:
+        ok, changes = booking.apply_batch(request.user.id, items, atomic=(mode == "atomic"))
+    except booking.BookingError as e:
+        return jsonify({"error": e.message}), e.status, {"Retry-After": "1"}
+
+    for d, slot_id, prenotati, delta in changes:
+        booking_changed(d, slot_id, prenotati, delta)
+
+    results = [{k: v for k, v in it.items() if k != "data"} for it in items]
+    status = 409 if (mode == "atomic" and not ok) else 200
+    return jsonify({"ok": ok, "mode": mode, "results": results}), status
+
+@bp.post("/bookings/batch")
+@require_auth
+def book_batch():
+    # {"mode": "atomic"|"best_effort", "operations": [{"op": "book"|"cancel", "slot_id", "date"}]}
+    return _run_batch(None)
+
+@bp.delete("/bookings/batch")
+@require_auth
+def cancel_batch():
+    return _run_batch("cancel")
+
+@bp.post("/bookings/series")
+@require_auth
+def book_series():
+    # {"slot_id", "from", "to"}: lo slot ogni settimana nel periodo (da oggi in poi)
+    data = request.get_json(force=True)
+    slot_id = data.get("slot_id")
+    from_str = (data.get("from") or "").strip()
+    to_str = (data.get("to") or "").strip()
+
+    if not slot_id or not from_str or not to_str:
+        return jsonify({"error": "Missing slot_id/from/to"}), 400
+    try:
+        d_from, d_to = max(parse_date(from_str), date.today()), parse_date(to_str)
+    except ValueError:
+        return jsonify({"error": "Invalid date"}), 400
+    if d_to < d_from or (d_to - d_from).days >= MAX_SERIES_WEEKS * 7:
+        return jsonify({"error": f"Invalid range (max {MAX_SERIES_WEEKS} weeks)"}), 400
+
+    slot = schedule.get(int(slot_id))
+    if not slot or not slot.attivo:
+        return jsonify({"error": "Slot not found/inactive"}), 404
+
+    capienza = slot.capienza
+    serie, booked, full, already = booking.book_series(request.user.id, slot, d_from, d_to)
+    for d, prenotati in booked.items():
+        booking_changed(d, slot.id, prenotati, +1, capienza)
+
+    result = {
+        "serie": serie.to_dict() if serie else None,
+        "booked": [d.isoformat() for d in booked],
+        "full": [d.isoformat() for d in full],
+        "already_booked": [d.isoformat() for d in already],
+    }
+    if not serie:
+        return jsonify({"error": "No date available", **result}), 409
+    return jsonify({"ok": True, **result}), 201
+
+@bp.get("/bookings/series")
+@require_auth(trust_claims=True)
+def my_series():
+    # serie attive dell'utente con le date future ancora prenotate
+    series = (
+        SeriePrenotazione.query
+        .filter_by(user_id=request.user.id, attiva=True)
+        .order_by(SeriePrenotazione.id)
+        .all()
+    )
+    upcoming = {}
+    if series:
+        rows = (
+            db.session.query(Prenotazione.serie_id, Prenotazione.data)
+            .filter(Prenotazione.user_id == request.user.id,
+                    Prenotazione.serie_id.in_([s.id for s in series]),
+                    Prenotazione.data >= date.today())
+            .order_by(Prenotazione.data)
+        )
+        for serie_id, d in rows:
+            upcoming.setdefault(serie_id, []).append(d.isoformat())
+    return jsonify({"series": [{**s.to_dict(), "dates": upcoming.get(s.id, [])} for s in series]})
+
+@bp.delete("/bookings/series/<int:serie_id>")
+@require_auth
+def cancel_series(serie_id):
+    # cancella le date future della serie (quelle passate restano nello storico)
+    try:
+        serie, cancelled = booking.cancel_series(request.user.id, serie_id, date.today())
+    except booking.BookingError as e:
+        return jsonify({"error": e.message}), e.status
+
+    for d, prenotati in cancelled.items():
+        booking_changed(d, serie.slot_id, prenotati, -1)
+    return jsonify({"ok": True, "cancelled": [d.isoformat() for d in cancelled]})
+
 # ---------------- ADMIN ----------------
 
 @bp.get("/admin/slots")
 @require_admin
 def admin_list_slots():
+    etag = f"admin-slots.{availability_cache.version_tag()}"
+    cached_resp = not_modified(etag)
+    if cached_resp:
+        return cached_resp
+
     slots = Slot.query.order_by(Slot.giorno_settimana.asc(), Slot.ora_inizio.asc()).all()
-    return jsonify({"slots": [s.to_dict() for s in slots]})
+    return with_etag(jsonify({"slots": [s.to_dict() for s in slots]}), etag)
 
 @bp.post("/admin/slots")
 @require_admin
@@ -177,18 +640,29 @@ def admin_create_slot():
 
     cap = data.get("capienza")
     capienza = None if cap in (None, "", "illimitata", "ILLIMITATA") else int(cap)
+    try:
+        ora_inizio, ora_fine = normalize_time(data["ora_inizio"]), normalize_time(data["ora_fine"])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     s = Slot(
         impianto=str(data["impianto"]).upper(),
         titolo=str(data["titolo"]).strip(),
         giorno_settimana=int(data["giorno_settimana"]),
-        ora_inizio=str(data["ora_inizio"]).strip(),
-        ora_fine=str(data["ora_fine"]).strip(),
+        ora_inizio=ora_inizio,
+        ora_fine=ora_fine,
         capienza=capienza,
         attivo=bool(data.get("attivo", True)),
     )
+    error = check_slot_times(s.impianto, s.giorno_settimana, s.ora_inizio, s.ora_fine, s.attivo)
+    if error:
+        return error
+
     db.session.add(s)
     db.session.commit()
+    schedule.rebuild()
+    availability_cache.clear()
+    bus.publish("slots")
     return jsonify({"slot": s.to_dict()})
 
 @bp.put("/admin/slots/<int:slot_id>")
@@ -199,12 +673,28 @@ def admin_update_slot(slot_id):
         return jsonify({"error": "Not found"}), 404
 
     data = request.get_json(force=True)
+    try:
+        ora_inizio = normalize_time(data["ora_inizio"]) if "ora_inizio" in data else s.ora_inizio
+        ora_fine = normalize_time(data["ora_fine"]) if "ora_fine" in data else s.ora_fine
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # controllo sui valori finali prima di toccare s (la sessione farebbe autoflush)
+    error = check_slot_times(
+        str(data["impianto"]).upper() if "impianto" in data else s.impianto,
+        int(data["giorno_settimana"]) if "giorno_settimana" in data else s.giorno_settimana,
+        ora_inizio,
+        ora_fine,
+        bool(data["attivo"]) if "attivo" in data else s.attivo,
+        exclude_id=s.id,
+    )
+    if error:
+        return error
 
     if "impianto" in data: s.impianto = str(data["impianto"]).upper()
     if "titolo" in data: s.titolo = str(data["titolo"]).strip()
     if "giorno_settimana" in data: s.giorno_settimana = int(data["giorno_settimana"])
-    if "ora_inizio" in data: s.ora_inizio = str(data["ora_inizio"]).strip()
-    if "ora_fine" in data: s.ora_fine = str(data["ora_fine"]).strip()
+    s.ora_inizio, s.ora_fine = ora_inizio, ora_fine
     if "attivo" in data: s.attivo = bool(data["attivo"])
 
     if "capienza" in data:
@@ -212,6 +702,9 @@ def admin_update_slot(slot_id):
         s.capienza = None if cap in (None, "", "illimitata", "ILLIMITATA") else int(cap)
 
     db.session.commit()
+    schedule.rebuild()
+    availability_cache.clear()
+    bus.publish("slots")
     return jsonify({"slot": s.to_dict()})
 
 @bp.get("/admin/bookings")
@@ -224,14 +717,20 @@ def admin_bookings_for_slot_date():
         return jsonify({"error": "Missing date/slot_id"}), 400
 
     d = parse_date(date_str)
+    etag = f"admin-bookings.{availability_cache.version_tag(d)}.{date_str}.{int(slot_id)}"
+    cached_resp = not_modified(etag)
+    if cached_resp:
+        return cached_resp
+
     slot = db.session.get(Slot, int(slot_id))
     if not slot:
         return jsonify({"error": "Slot not found"}), 404
 
+    p = archive.bookings_source(d, d)
     bookings = (
-        db.session.query(Prenotazione, User)
-        .join(User, User.id == Prenotazione.user_id)
-        .filter(Prenotazione.slot_id == slot.id, Prenotazione.data == d)
+        db.session.query(User)
+        .join(p, p.c.user_id == User.id)
+        .filter(p.c.slot_id == slot.id, p.c.data == d)
         .order_by(User.cognome.asc(), User.nome.asc())
         .all()
     )
@@ -241,13 +740,13 @@ def admin_bookings_for_slot_date():
         "cognome": u.cognome,
         "gruppo": u.gruppo,
         "email": u.email
-    } for _, u in bookings]
+    } for u in bookings]
 
-    return jsonify({
+    return with_etag(jsonify({
         "date": date_str,
         "slot": slot.to_dict(),
         "prenotati": people
-    })
+    }), etag)
 
 @bp.get("/admin/export")
 @require_admin
@@ -263,10 +762,11 @@ def admin_export_csv():
     if not slot:
         return jsonify({"error": "Slot not found"}), 404
 
+    p = archive.bookings_source(d, d)
     rows = (
         db.session.query(User)
-        .join(Prenotazione, Prenotazione.user_id == User.id)
-        .filter(Prenotazione.slot_id == slot.id, Prenotazione.data == d)
+        .join(p, p.c.user_id == User.id)
+        .filter(p.c.slot_id == slot.id, p.c.data == d)
         .order_by(User.cognome.asc(), User.nome.asc())
         .all()
     )
@@ -286,3 +786,90 @@ def admin_export_csv():
         mimetype="text/csv",
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
+
+@bp.get("/admin/export/range")
+@require_admin
+def admin_export_range_csv():
+    # statini di più giorni/slot in un unico CSV, inviato in streaming
+    from_str = (request.args.get("from") or "").strip()
+    to_str = (request.args.get("to") or "").strip()
+    impianto = (request.args.get("impianto") or "").strip().upper()
+    slot_ids = [int(x) for x in (request.args.get("slot_ids") or "").split(",") if x.strip()]
+
+    if not from_str or not to_str:
+        return jsonify({"error": "Missing from/to"}), 400
+
+    d_from = parse_date(from_str)
+    d_to = parse_date(to_str)
+    if d_to < d_from:
+        return jsonify({"error": "Invalid range"}), 400
+
+    rows = bookings_query(d_from, d_to, impianto=impianto or None, slot_ids=slot_ids or None)
+
+    filename = f"statini_{impianto or 'TUTTI'}_{from_str}_{to_str}.csv"
+    return Response(
+        stream_with_context(iter_csv(rows)),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@bp.get("/admin/stats")
+@require_admin
+def admin_stats():
+    # occupazione per impianto/slot/giorno dal rollup slot_occupancy
+    from_str = (request.args.get("from") or "").strip()
+    to_str = (request.args.get("to") or "").strip()
+    group_by = (request.args.get("group_by") or "impianto").strip().lower()
+
+    if not from_str or not to_str:
+        return jsonify({"error": "Missing from/to"}), 400
+    if group_by not in stats.GROUP_BY:
+        return jsonify({"error": f"Invalid group_by ({', '.join(stats.GROUP_BY)})"}), 400
+
+    d_from = parse_date(from_str)
+    d_to = parse_date(to_str)
+    n_days = (d_to - d_from).days + 1
+    if n_days < 1 or n_days > stats.MAX_STATS_DAYS:
+        return jsonify({"error": f"Invalid range (max {stats.MAX_STATS_DAYS} days)"}), 400
+
+    groups, total = stats.occupancy_stats(d_from, d_to, group_by)
+    return jsonify({"from": from_str, "to": to_str, "group_by": group_by, "groups": groups, "totale": total})
+
+@bp.post("/admin/reports")
+@require_admin
+def admin_create_report():
+    data = request.get_json(force=True)
+    tipo = str(data.get("tipo") or "").strip()
+    params = data.get("parametri") or {}
+
+    try:
+        job = reports.enqueue(tipo, params, user_id=request.user.id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({"job": job.to_dict()}), 202
+
+@bp.get("/admin/reports/<int:job_id>")
+@require_admin
+def admin_report_status(job_id):
+    job = db.session.get(ReportJob, job_id)
+    if not job:
+        return jsonify({"error": "Not found"}), 404
+    return jsonify({"job": job.to_dict()})
+
+@bp.get("/admin/reports/<int:job_id>/download")
+@require_admin
+def admin_report_download(job_id):
+    job = db.session.get(ReportJob, job_id)
+    if not job:
+        return jsonify({"error": "Not found"}), 404
+    if job.stato != "DONE" or not job.file_path or not os.path.exists(job.file_path):
+        return jsonify({"error": "Report not ready", "stato": job.stato}), 409
+
+    ext = os.path.splitext(job.file_path)[1]
+    return send_file(job.file_path, as_attachment=True, download_name=f"{job.tipo}_{job.id}{ext}")
+
+@bp.get("/metrics")
+@require_admin
+def metrics_text():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
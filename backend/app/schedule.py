@@ -0,0 +1,125 @@
+import threading
+import time
+from bisect import bisect_left
+
+from app.models import Slot
+
+# Orario settimanale compilato in memoria: gli slot cambiano raramente (admin),
+# quindi GET /api/slots e book() non interrogano la tabella slots a ogni
+# richiesta. Indice per (giorno_settimana, impianto), orari in minuti dalla
+# mezzanotte così l'ordinamento è numerico ("9:00" < "10:00"). Lo snapshot è
+# immutabile e viene sostituito in blocco: i lettori non prendono lock.
+# Si ricompila dopo ogni modifica admin e, per vedere le modifiche fatte da
+# altri worker, al più ogni SCHEDULE_TTL secondi.
+
+
+def to_minutes(hhmm):
+    h, sep, m = str(hhmm).strip().partition(":")
+    if not sep or not h.isdigit() or not m.isdigit() or len(m) != 2:
+        raise ValueError(f"Invalid time {hhmm!r} (HH:MM)")
+    h, m = int(h), int(m)
+    if h > 24 or m > 59 or (h == 24 and m):
+        raise ValueError(f"Invalid time {hhmm!r} (HH:MM)")
+    return h * 60 + m
+
+
+def normalize_time(hhmm):
+    # "9:00" -> "09:00": salvati a due cifre, gli orari come stringhe si
+    # ordinano come i minuti (ORDER BY e cursori keyset su ora_inizio)
+    minutes = to_minutes(hhmm)
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class ScheduledSlot:
+    __slots__ = ("id", "impianto", "giorno_settimana", "inizio", "fine", "capienza", "attivo", "data")
+
+    def __init__(self, s):
+        self.id = s.id
+        self.impianto = s.impianto
+        self.giorno_settimana = s.giorno_settimana
+        self.inizio = to_minutes(s.ora_inizio)
+        self.fine = to_minutes(s.ora_fine)
+        self.capienza = s.capienza
+        self.attivo = s.attivo
+        self.data = s.to_dict()  # condiviso in sola lettura dalle risposte
+
+    def is_unlimited(self):
+        return self.capienza is None
+
+
+class _Snapshot:
+    __slots__ = ("by_id", "by_day", "loaded_at")
+
+    def __init__(self, slots):
+        self.by_id = {s.id: s for s in slots}
+        # (giorno, impianto) -> slot attivi ordinati per inizio; impianto None = tutti
+        self.by_day = {}
+        for s in sorted(slots, key=lambda s: (s.inizio, s.fine, s.id)):
+            if not s.attivo:
+                continue
+            self.by_day.setdefault((s.giorno_settimana, s.impianto), []).append(s)
+            self.by_day.setdefault((s.giorno_settimana, None), []).append(s)
+        self.loaded_at = time.monotonic()
+
+
+class Schedule:
+    def __init__(self, ttl=60.0):
+        self.ttl = ttl
+        self._snapshot = None
+        self._lock = threading.Lock()  # una sola ricompilazione alla volta
+
+    def init_app(self, app):
+        self.ttl = float(app.config.get("SCHEDULE_TTL", self.ttl))
+        self._snapshot = None
+
+    def _fresh(self, snap):
+        return snap is not None and (self.ttl <= 0 or time.monotonic() - snap.loaded_at <= self.ttl)
+
+    def rebuild(self):
+        with self._lock:
+            self._snapshot = _Snapshot([ScheduledSlot(s) for s in Slot.query.all()])
+            return self._snapshot
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def _current(self):
+        snap = self._snapshot
+        if self._fresh(snap):
+            return snap
+        with self._lock:
+            # un altro thread può averlo appena ricompilato
+            if not self._fresh(self._snapshot):
+                self._snapshot = _Snapshot([ScheduledSlot(s) for s in Slot.query.all()])
+            return self._snapshot
+
+    def get(self, slot_id):
+        # anche slot non attivi: chi chiama controlla .attivo
+        return self._current().by_id.get(slot_id)
+
+    def peek(self, giorno_settimana, impianto=None):
+        # come for_weekday ma senza ricompilare (None se scaduto): per il server
+        # ASGI, che non può fare query sincrone nel suo event loop
+        snap = self._snapshot
+        if not self._fresh(snap):
+            return None
+        return snap.by_day.get((giorno_settimana, impianto or None), [])
+
+    def all_slots(self):
+        return list(self._current().by_id.values())
+
+    def for_weekday(self, giorno_settimana, impianto=None):
+        return self._current().by_day.get((giorno_settimana, impianto or None), [])
+
+    def for_date(self, d, impianto=None):
+        return self.for_weekday(d.weekday() + 1, impianto)
+
+    def overlaps(self, impianto, giorno_settimana, inizio, fine, exclude_id=None):
+        # slot attivi dello stesso impianto/giorno che si sovrappongono a [inizio, fine)
+        day = self.for_weekday(giorno_settimana, impianto)
+        # gli slot che iniziano dopo "fine" non possono sovrapporsi
+        end = bisect_left(day, fine, key=lambda s: s.inizio)
+        return [s for s in day[:end] if s.fine > inizio and s.id != exclude_id]
+
+
+schedule = Schedule()
@@ -1,11 +1,122 @@
 from __future__ import annotations
 
-from passlib.context import CryptContext
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeout
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# PASSWORD_METHOD: metodo werkzeug ("scrypt", "scrypt:32768:8:1",
+# "pbkdf2:sha256:600000", ...) oppure "bcrypt[:rounds]" (richiede passlib).
+DEFAULT_METHOD = "scrypt"
+
+_bcrypt_contexts = {}
+
+
+def _bcrypt_context(rounds):
+    ctx = _bcrypt_contexts.get(rounds)
+    if ctx is None:
+        from passlib.context import CryptContext  # opzionale: solo per bcrypt
+        ctx = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+        _bcrypt_contexts[rounds] = ctx
+    return ctx
+
+
+def _bcrypt_rounds(method):
+    _, _, rounds = method.partition(":")
+    return int(rounds or 12)
+
+
+def hash_password(password: str, method: str = DEFAULT_METHOD) -> str:
+    if method.startswith("bcrypt"):
+        return _bcrypt_context(_bcrypt_rounds(method)).hash(password)
+    return generate_password_hash(password, method=method)
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
 
 def verify_password(password: str, hashed: str) -> bool:
-    return pwd_context.verify(password, hashed)
+    if hashed.startswith("$2"):
+        return _bcrypt_context(12).verify(password, hashed)
+    return check_password_hash(hashed, password)
+
+
+class PasswordBusy(Exception):
+    pass
+
+
+class PasswordHasher:
+    # Unico servizio di hashing: metodo/costo configurabili e verifica in un
+    # pool limitato (thread o processi). Se ci sono già troppe verifiche in
+    # coda si rifiuta subito (PasswordBusy -> 503) invece di bloccare i worker.
+
+    def __init__(self, method=DEFAULT_METHOD, workers=4, queue=32, timeout=10.0, pool="thread"):
+        self.method = method
+        self.workers = workers
+        self.queue = queue
+        self.timeout = timeout
+        self.pool = pool
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self._prefix = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.method = app.config.get("PASSWORD_METHOD", self.method)
+        self.workers = int(app.config.get("PASSWORD_WORKERS", self.workers))
+        self.queue = int(app.config.get("PASSWORD_QUEUE", self.queue))
+        self.timeout = float(app.config.get("PASSWORD_TIMEOUT", self.timeout))
+        self.pool = app.config.get("PASSWORD_POOL", self.pool)
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue)
+        self._prefix = None
+        self.shutdown()
+
+    def _get_executor(self):
+        # creato al primo uso: dopo il fork di gunicorn, non nel master
+        with self._lock:
+            if self._executor is None:
+                if self.pool == "process":
+                    from concurrent.futures import ProcessPoolExecutor  # multiprocessing solo se serve
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordBusy()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # il posto si libera quando il lavoro finisce davvero, anche dopo un timeout
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FuturesTimeout:
+            raise PasswordBusy()
+
+    def hash(self, password: str) -> str:
+        return self._run(hash_password, password, self.method)
+
+    def check(self, password: str, hashed: str) -> bool:
+        return self._run(verify_password, password, hashed)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        if self.method.startswith("bcrypt"):
+            if not hashed.startswith("$2"):
+                return True
+            return _bcrypt_context(_bcrypt_rounds(self.method)).needs_update(hashed)
+
+        if self._prefix is None:
+            # "scrypt" -> "scrypt:32768:8:1": parametri effettivi di werkzeug
+            self._prefix = generate_password_hash("", method=self.method).split("$", 1)[0]
+        return hashed.split("$", 1)[0] != self._prefix
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,129 @@
+from datetime import timedelta
+
+from sqlalchemy import func, select, update
+
+from app import db
+from app.archive import bookings_source
+from app.booking import _insert
+from app.models import SlotOccupancy
+from app.schedule import schedule
+
+# Statistiche di occupazione dal rollup slot_occupancy (un contatore per
+# slot/data, mantenuto da app.booking a ogni prenotazione/cancellazione):
+# una GROUP BY slot_id sul periodo, il resto (impianto, giorno, capienza) viene
+# dall'orario compilato. La capienza è quella attuale degli slot.
+
+GROUP_BY = ("impianto", "slot", "weekday")
+MAX_STATS_DAYS = 366
+
+
+def _weekday_count(d_from, d_to, giorno_settimana):
+    # quante date del periodo cadono nel giorno (1=Lun..7=Dom)
+    first = d_from + timedelta(days=(giorno_settimana - 1 - d_from.weekday()) % 7)
+    if first > d_to:
+        return 0
+    return (d_to - first).days // 7 + 1
+
+
+def _group_key(slot, group_by):
+    if group_by == "impianto":
+        return slot.impianto
+    if group_by == "weekday":
+        return slot.giorno_settimana
+    return slot.id
+
+
+def occupancy_stats(d_from, d_to, group_by="impianto"):
+    rows = db.session.execute(
+        select(SlotOccupancy.slot_id, func.sum(SlotOccupancy.prenotati), func.count())
+        .where(SlotOccupancy.data >= d_from, SlotOccupancy.data <= d_to, SlotOccupancy.prenotati > 0)
+        .group_by(SlotOccupancy.slot_id)
+    ).all()
+    booked = {slot_id: (int(n), days) for slot_id, n, days in rows}
+
+    groups = {}
+    for slot in sorted(schedule.all_slots(), key=lambda s: s.id):
+        n, days = booked.get(slot.id, (0, 0))
+        # slot attivo: tutte le date del suo giorno; disattivato: solo quelle con prenotazioni
+        sessioni = _weekday_count(d_from, d_to, slot.giorno_settimana) if slot.attivo else days
+        if not sessioni:
+            continue
+
+        key = _group_key(slot, group_by)
+        g = groups.get(key)
+        if g is None:
+            g = groups[key] = {
+                "key": key,
+                "prenotati": 0,
+                "sessioni": 0,
+                "posti": 0,
+                "illimitati": {"prenotati": 0, "sessioni": 0},
+            }
+            if group_by == "slot":
+                g["slot"] = slot.data
+
+        # slot illimitati (CAMPI): nessun tasso di occupazione, solo presenze
+        if slot.is_unlimited():
+            g["illimitati"]["prenotati"] += n
+            g["illimitati"]["sessioni"] += sessioni
+        else:
+            g["prenotati"] += n
+            g["sessioni"] += sessioni
+            g["posti"] += slot.capienza * sessioni
+
+    def finish(g):
+        g["utilizzo"] = round(g["prenotati"] / g["posti"], 4) if g["posti"] else None
+        ill = g["illimitati"]
+        ill["media_per_sessione"] = round(ill["prenotati"] / ill["sessioni"], 2) if ill["sessioni"] else None
+        return g
+
+    total = {"key": None, "prenotati": 0, "sessioni": 0, "posti": 0, "illimitati": {"prenotati": 0, "sessioni": 0}}
+    for g in groups.values():
+        for k in ("prenotati", "sessioni", "posti"):
+            total[k] += g[k]
+        for k in ("prenotati", "sessioni"):
+            total["illimitati"][k] += g["illimitati"][k]
+
+    return [finish(groups[k]) for k in sorted(groups)], finish(total)
+
+
+def backfill(d_from=None, d_to=None, fix=False):
+    # Crea i contatori mancanti (prenotazioni precedenti al rollup) contando le
+    # prenotazioni, archiviate comprese. ON CONFLICT DO NOTHING: un contatore
+    # creato nel frattempo da book() è già corretto e non va toccato, quindi si
+    # può lanciare a caldo. fix=True riallinea anche i contatori esistenti: da
+    # fare a sportello chiuso, perché una prenotazione in corso durante il
+    # ricalcolo verrebbe persa.
+    p = bookings_source(d_from, d_to)
+    where = []
+    if d_from:
+        where.append(p.c.data >= d_from)
+    if d_to:
+        where.append(p.c.data <= d_to)
+
+    counts = (
+        select(p.c.slot_id, p.c.data, func.count(p.c.id))
+        .where(*where or [p.c.id.isnot(None)])  # SQLite: INSERT ... SELECT ... ON CONFLICT vuole un WHERE
+        .group_by(p.c.slot_id, p.c.data)
+    )
+    stmt = _insert(SlotOccupancy).from_select(["slot_id", "data", "prenotati"], counts).on_conflict_do_nothing()
+    created = db.session.execute(stmt).rowcount
+
+    fixed = 0
+    if fix:
+        actual = (
+            select(func.count(p.c.id))
+            .where(p.c.slot_id == SlotOccupancy.slot_id, p.c.data == SlotOccupancy.data)
+            .scalar_subquery()
+        )
+        occ_where = []
+        if d_from:
+            occ_where.append(SlotOccupancy.data >= d_from)
+        if d_to:
+            occ_where.append(SlotOccupancy.data <= d_to)
+        fixed = db.session.execute(
+            update(SlotOccupancy).where(*occ_where, SlotOccupancy.prenotati != actual).values(prenotati=actual)
+        ).rowcount
+
+    db.session.commit()
+    return created, fixed
@@ -0,0 +1,31 @@
+import argparse
+from datetime import date
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app import create_app, db
+from app import archive
+from app.models import Prenotazione
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sposta le prenotazioni passate in prenotazioni_archive")
+    parser.add_argument("--before", type=date.fromisoformat,
+                        help="YYYY-MM-DD (default: oggi - ARCHIVE_AFTER_DAYS)")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--dry-run", action="store_true", help="conta soltanto")
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()  # prenotazioni_archive su DB esistenti
+        cutoff = args.before or archive.cutoff_for(app)
+        if args.dry_run:
+            n = Prenotazione.query.filter(Prenotazione.data < cutoff).count()
+            print(f"[DRY-RUN] {n} prenotazioni prima del {cutoff}")
+            return
+        moved = archive.archive_before(cutoff, args.batch_size or app.config["ARCHIVE_BATCH_SIZE"])
+        print(f"[OK] Archiviate {moved} prenotazioni prima del {cutoff}")
+
+if __name__ == "__main__":
+    main()
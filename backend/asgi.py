@@ -0,0 +1,10 @@
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app.asgi import create_asgi_app
+
+# Modalità async (vedi app/asgi.py):
+#   uvicorn asgi:app --host 0.0.0.0 --port $PORT --workers 2
+#   gunicorn -k uvicorn.workers.UvicornWorker -w 2 asgi:app
+app = create_asgi_app()
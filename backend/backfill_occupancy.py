@@ -0,0 +1,25 @@
+import argparse
+from datetime import date
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app import create_app, db
+from app import stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ricostruisce il rollup slot_occupancy dalle prenotazioni")
+    parser.add_argument("--from", dest="d_from", type=date.fromisoformat, help="YYYY-MM-DD (default: tutto)")
+    parser.add_argument("--to", dest="d_to", type=date.fromisoformat, help="YYYY-MM-DD (default: tutto)")
+    parser.add_argument("--fix", action="store_true",
+                        help="riallinea anche i contatori esistenti (solo a prenotazioni ferme)")
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        created, fixed = stats.backfill(args.d_from, args.d_to, fix=args.fix)
+        print(f"[OK] Contatori creati: {created}, corretti: {fixed}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import argparse
+import http.client
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from common import (
+    free_port, git_revision, latency_summary, next_weekday, request, save_results,
+    seed_database, start_server, stop_server,
+)
+
+# Capacità di connessioni concorrenti su GET /api/slots: server WSGI
+# (werkzeug/gunicorn gthread) contro modalità ASGI (uvicorn asgi:app), a
+# livelli crescenti di client concorrenti. Per ogni livello: throughput,
+# latenze ed errori (timeout/connessioni rifiutate).
+#
+#   python bench/asgi_capacity.py --servers werkzeug,uvicorn --levels 25,50,100,200
+#   python bench/asgi_capacity.py --servers gunicorn,uvicorn --workers 2 --no-cache
+#
+# Con --streams N, dopo i livelli: N stream SSE aperti su GET /api/slots/stream
+# e intanto login + prenotazioni in sequenza (latenze, stato, timeout) e
+# eventi ricevuti dagli stream. Uno stream tiene occupato un thread del server
+# finché resta aperto: login e scritture non devono restare in coda dietro.
+#
+#   python bench/asgi_capacity.py --servers uvicorn --levels 50 --streams 40 --workers 1
+
+
+def client(base_url, token, date_str, latencies, status, stop, timeout):
+    while not stop.is_set():
+        try:
+            code, _, _, elapsed = request(base_url, "GET", f"/api/slots?date={date_str}", token, timeout=timeout)
+        except OSError as e:  # timeout, connessione rifiutata/chiusa
+            status[type(e).__name__] += 1
+            continue
+        latencies.append(elapsed)
+        status[code] += 1
+
+
+def run_level(base_url, tokens, date_str, clients, duration, timeout):
+    latencies, status = [], Counter()
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=client, args=(base_url, tokens[i % len(tokens)], date_str, latencies, status, stop, timeout))
+        for i in range(clients)
+    ]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return {**latency_summary(latencies), "rps": round(len(latencies) / elapsed, 1), "status": dict(status)}
+
+
+def stream_reader(port, token, date_str, opened, events, stop, timeout):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        conn.request("GET", f"/api/slots/stream?date={date_str}&access_token={token}")
+        resp = conn.getresponse()
+        opened[resp.status] += 1
+        if resp.status != 200:
+            return
+        while not stop.is_set():
+            line = resp.fp.readline()
+            if not line:
+                return
+            if line.startswith(b"event: slot"):
+                events[0] += 1
+    except OSError as e:
+        opened[type(e).__name__] += 1
+    finally:
+        conn.close()
+
+
+def run_streams(base_url, port, tokens, emails, slot_ids, date_str, streams, writes, timeout):
+    opened, events, stop = Counter(), [0], threading.Event()
+    readers = [
+        threading.Thread(target=stream_reader, args=(port, tokens[i % len(tokens)], date_str, opened, events, stop,
+                                                     timeout), daemon=True)
+        for i in range(streams)
+    ]
+    for t in readers:
+        t.start()
+    time.sleep(1.0)  # stream aperti (o rifiutati) prima delle scritture
+
+    latencies, status = {"login": [], "book": []}, Counter()
+    for i in range(writes):
+        try:
+            code, _, body, elapsed = request(base_url, "POST", "/api/auth/login",
+                                             body={"email": emails[i % len(emails)], "password": "bench"},
+                                             timeout=timeout)
+            latencies["login"].append(elapsed)
+            status[f"login {code}"] += 1
+            code, _, _, elapsed = request(base_url, "POST", "/api/bookings", body["token"],
+                                          {"slot_id": slot_ids[i % len(slot_ids)], "date": date_str}, timeout=timeout)
+            latencies["book"].append(elapsed)
+            status[f"book {code}"] += 1
+        except OSError as e:
+            status[type(e).__name__] += 1
+    time.sleep(0.5)  # ultimi eventi
+    stop.set()
+    return {
+        "streams": dict(opened),
+        "events": events[0],
+        "login": latency_summary(latencies["login"]),
+        "book": latency_summary(latencies["book"]),
+        "status": dict(status),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Connessioni concorrenti su /api/slots: WSGI contro ASGI")
+    parser.add_argument("--servers", default="werkzeug,uvicorn", help="werkzeug, gunicorn, uvicorn")
+    parser.add_argument("--levels", default="25,50,100,200", help="client concorrenti per livello")
+    parser.add_argument("--duration", type=float, default=10.0, help="secondi per livello")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=10.0, help="timeout per richiesta (s)")
+    parser.add_argument("--streams", type=int, default=0, help="stream SSE aperti durante login e prenotazioni")
+    parser.add_argument("--writes", type=int, default=40, help="login + prenotazioni con gli stream aperti")
+    parser.add_argument("--no-cache", action="store_true", help="AVAILABILITY_CACHE_SIZE=0: ogni lettura va sul DB")
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args(argv)
+
+    levels = [int(x) for x in args.levels.split(",") if x.strip()]
+    results = {"config": vars(args), "revision": git_revision(), "servers": {}}
+    day = next_weekday(3)
+
+    for server in [s.strip() for s in args.servers.split(",") if s.strip()]:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='sport-bench-'), 'bench.db')}"
+        emails, slots = seed_database(database_url, args.users)
+        extra_env = {"AVAILABILITY_CACHE_SIZE": "0"} if args.no_cache else {}
+        port = free_port()
+        proc = start_server(database_url, port, server, args.workers, extra_env=extra_env)
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            tokens = [request(base_url, "POST", "/api/auth/login", body={"email": e, "password": "bench"})[2]["token"]
+                      for e in emails]
+            print(f"[RUN] {server}")
+            r = results["servers"][server] = {}
+            for clients in levels:
+                x = r[str(clients)] = run_level(base_url, tokens, day.isoformat(), clients, args.duration, args.timeout)
+                print(f"  clients={clients:4d} {x['rps']:7.1f} req/s p50={x['p50_ms']}ms p95={x['p95_ms']}ms "
+                      f"p99={x['p99_ms']}ms status={x['status']}")
+            if args.streams:
+                slot_ids = [sl["id"] for sl in slots if sl["giorno_settimana"] == 3]
+                x = r["streams"] = run_streams(base_url, port, tokens, emails, slot_ids, day.isoformat(),
+                                               args.streams, args.writes, args.timeout)
+                print(f"  streams={args.streams} opened={x['streams']} events={x['events']} "
+                      f"login p50={x['login']['p50_ms']}ms max={x['login']['max_ms']}ms "
+                      f"book p50={x['book']['p50_ms']}ms max={x['book']['max_ms']}ms status={x['status']}")
+        finally:
+            stop_server(proc)
+
+    path = save_results("asgi_capacity", results, args.out)
+    print(f"[OK] results: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from common import (
+    free_port, git_revision, latency_summary, next_weekday, request, save_results,
+    seed_database, start_server, stop_server,
+)
+
+# Coerenza delle cache tra worker: N processi server indipendenti sullo
+# stesso DB (come N worker gunicorn), cache disponibilità calda in tutti e TTL
+# lungo. A ogni giro un client prenota su un worker (a turno) e gli altri
+# vengono interrogati finché GET /api/slots non mostra il nuovo conteggio:
+# tempo di propagazione per lettore, letture rimaste vecchie oltre --timeout
+# e, alla fine, confronto dei conteggi di tutti i worker con il DB.
+#
+#   python bench/coherence.py --transports off,table --workers 3 --rounds 40
+#   python bench/coherence.py --transports table,postgres --database-url postgresql+psycopg2://...
+
+
+def counts(base_url, token, date_str):
+    code, _, body, _ = request(base_url, "GET", f"/api/slots?date={date_str}", token)
+    if code != 200:
+        raise RuntimeError(f"GET /api/slots -> {code}")
+    return {s["id"]: s["prenotati"] for s in body["slots"]}
+
+
+def wait_for(base_url, token, date_str, slot_id, expected, timeout, out):
+    # secondi finché il worker mostra il conteggio atteso, None se non succede entro timeout
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if counts(base_url, token, date_str).get(slot_id) == expected:
+            out.append(time.perf_counter() - started)
+            return
+        time.sleep(0.002)
+    out.append(None)
+
+
+def run_transport(transport, args, database_url):
+    emails, slots = seed_database(database_url, args.rounds)
+    day = next_weekday(2)
+    date_str = day.isoformat()
+    slot_ids = [s["id"] for s in slots if s["giorno_settimana"] == 2]
+
+    env = {"BUS_TRANSPORT": transport, "AVAILABILITY_CACHE_TTL": "600"}
+    procs, urls = [], []
+    try:
+        for _ in range(args.workers):
+            port = free_port()
+            procs.append(start_server(database_url, port, "werkzeug", extra_env=env))
+            urls.append(f"http://127.0.0.1:{port}")
+
+        tokens = []
+        for email in emails:
+            _, _, body, _ = request(urls[0], "POST", "/api/auth/login", body={"email": email, "password": "bench"})
+            tokens.append(body["token"])
+
+        # cache calda in tutti i worker (e bus avviato dalla prima richiesta)
+        for url in urls:
+            counts(url, tokens[0], date_str)
+        time.sleep(0.2)
+
+        expected = Counter()
+        delays, status = [], Counter()
+        for r in range(args.rounds):
+            writer = urls[r % len(urls)]
+            slot_id = slot_ids[r % len(slot_ids)]
+            code, _, _, _ = request(writer, "POST", "/api/bookings", tokens[r], {"slot_id": slot_id, "date": date_str})
+            status[code] += 1
+            if code != 200:
+                continue
+            expected[slot_id] += 1
+
+            readers = [u for u in urls if u != writer]
+            threads = [
+                threading.Thread(target=wait_for, args=(u, tokens[0], date_str, slot_id, expected[slot_id],
+                                                        args.timeout, delays))
+                for u in readers
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        final = [counts(url, tokens[0], date_str) for url in urls]
+    finally:
+        for proc in procs:
+            stop_server(proc)
+
+    propagated = [d for d in delays if d is not None]
+    truth = {slot_id: expected[slot_id] for slot_id in slot_ids}
+    return {
+        "propagation": latency_summary(propagated),
+        "stale_reads": sum(1 for d in delays if d is None),
+        "checks": len(delays),
+        "booking_status": dict(status),
+        "coherent_workers": sum(1 for c in final if all(c.get(s, 0) == n for s, n in truth.items())),
+        "workers": len(urls),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Propagazione delle prenotazioni tra le cache di più worker")
+    parser.add_argument("--transports", default="off,table", help="lista di BUS_TRANSPORT separati da virgola")
+    parser.add_argument("--workers", type=int, default=3, help="processi server sullo stesso DB")
+    parser.add_argument("--rounds", type=int, default=40)
+    parser.add_argument("--timeout", type=float, default=2.0, help="secondi oltre i quali una lettura è vecchia")
+    parser.add_argument("--database-url", default=None, help="default: un SQLite temporaneo nuovo per ogni trasporto")
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args(argv)
+
+    results = {"config": vars(args), "revision": git_revision(), "transports": {}}
+    for transport in [t.strip() for t in args.transports.split(",") if t.strip()]:
+        database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='sport-bench-'), 'bench.db')}"
+        print(f"[RUN] {transport} on {database_url.split('@')[-1]}")
+        r = results["transports"][transport] = run_transport(transport, args, database_url)
+        p = r["propagation"]
+        print(f"  propagated {p['count']}/{r['checks']} p50={p['p50_ms']}ms p95={p['p95_ms']}ms max={p['max_ms']}ms "
+              f"stale={r['stale_reads']} coherent workers={r['coherent_workers']}/{r['workers']}")
+
+    path = save_results("coherence", results, args.out)
+    print(f"[OK] results: {path}")
+
+
+if __name__ == "__main__":
+    main()
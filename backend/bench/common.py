@@ -0,0 +1,156 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from datetime import date, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "bench", "results")
+
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def next_weekday(dow, start=None):
+    # prossima data (da domani) con giorno_settimana = dow (1=lun..7=dom)
+    d = (start or date.today()) + timedelta(days=1)
+    while d.weekday() + 1 != dow:
+        d += timedelta(days=1)
+    return d
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def seed_database(database_url, n_users, password="bench", password_method="pbkdf2:sha256:1000"):
+    # DB sintetico: slot di init_db.seed_slots() + n_users utenti con la stessa
+    # password (un solo hash calcolato, riusato per tutti). Ritorna le email.
+    os.environ["DATABASE_URL"] = database_url
+    from sqlalchemy import insert
+    from app import create_app, db, migrations
+    from app.models import User, Slot
+    from app.security import hash_password
+    import init_db
+
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        migrations.upgrade()
+        init_db.seed_slots()
+        password_hash = hash_password(password, password_method)
+        emails = [f"bench.user{i}@smam.local" for i in range(n_users)]
+        rows = [
+            {"nome": "Bench", "cognome": f"User{i}", "gruppo": f"G{i % 10}", "ruolo": "ADMIN" if i == 0 else "USER",
+             "email": email, "password_hash": password_hash}
+            for i, email in enumerate(emails)
+        ]
+        for i in range(0, len(rows), 1000):
+            db.session.execute(insert(User), rows[i:i + 1000])
+        db.session.commit()
+        slots = [s.to_dict() for s in Slot.query.all()]
+        db.engine.dispose()
+    return emails, slots
+
+
+def start_server(database_url, port, server="werkzeug", workers=2, extra_env=None):
+    env = dict(os.environ, DATABASE_URL=database_url, BENCH_SQL_HEADER="1", **(extra_env or {}))
+    if server == "gunicorn":
+        cmd = [sys.executable, "-m", "gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}",
+               "--worker-class", "gthread", "--threads", "8", "bench.server:app"]
+    elif server == "uvicorn":
+        # modalità async (asgi.py); niente header X-Bench-SQL sulle route async
+        cmd = [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(workers), "--log-level", "warning"]
+    else:
+        cmd = [sys.executable, os.path.join(BACKEND_DIR, "bench", "server.py"), str(port)]
+    # log su file: una PIPE non letta si riempie e blocca il server
+    log = tempfile.TemporaryFile()
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=log)
+    proc.log = log
+    wait_ready(f"http://127.0.0.1:{port}/api/health", proc)
+    return proc
+
+
+def wait_ready(url, proc=None, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            proc.log.seek(0)
+            raise RuntimeError(f"server exited: {proc.log.read().decode()[-2000:]}")
+        try:
+            urllib.request.urlopen(url, timeout=1)
+            return
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.02)
+    raise RuntimeError(f"server not ready: {url}")
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def request(base_url, method, path, token=None, body=None, headers=None, timeout=30):
+    # ritorna (status, headers, json|None, secondi)
+    data = json.dumps(body).encode() if body is not None else None
+    h = {"Content-Type": "application/json", **(headers or {})}
+    if token:
+        h["Authorization"] = f"Bearer {token}"
+    req = urllib.request.Request(base_url + path, data=data, method=method, headers=h)
+    t = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as r:
+            raw, status, rh = r.read(), r.status, r.headers
+    except urllib.error.HTTPError as e:
+        raw, status, rh = e.read(), e.code, e.headers
+    elapsed = time.perf_counter() - t
+    try:
+        payload = json.loads(raw) if raw else None
+    except ValueError:
+        payload = None
+    return status, rh, payload, elapsed
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    k = min(int(round(p / 100 * (len(values) - 1))), len(values) - 1)
+    return values[k]
+
+
+def latency_summary(values):
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 2) if values else None,
+        "p95_ms": round(percentile(values, 95) * 1000, 2) if values else None,
+        "p99_ms": round(percentile(values, 99) * 1000, 2) if values else None,
+        "max_ms": round(max(values) * 1000, 2) if values else None,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(name, results, out=None):
+    path = out or os.path.join(RESULTS_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, default=str)
+    return path
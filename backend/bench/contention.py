@@ -0,0 +1,112 @@
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from common import (
+    free_port, git_revision, latency_summary, next_weekday, request, save_results,
+    seed_database, start_server, stop_server,
+)
+
+# Letture concorrenti di GET /api/slots mentre altri client prenotano e
+# cancellano, per ogni profilo DB (DB_PROFILE). La cache disponibilità è
+# spenta, così ogni lettura va sul DB e si vede l'effetto del journal/lock.
+#
+#   python bench/contention.py --profiles none,sqlite --readers 30 --writers 10
+#   python bench/contention.py --database-url postgresql+psycopg2://... --profiles none,postgres
+
+
+def reader(base_url, token, date_str, latencies, status, stop):
+    while not stop.is_set():
+        code, _, _, elapsed = request(base_url, "GET", f"/api/slots?date={date_str}", token)
+        latencies.append(elapsed)
+        status[code] += 1
+
+
+def writer(base_url, token, slots, date_str, latencies, status, stop):
+    while not stop.is_set():
+        slot_id = random.choice(slots)["id"]
+        for method in ("POST", "DELETE"):
+            code, _, _, elapsed = request(base_url, method, "/api/bookings", token, {"slot_id": slot_id, "date": date_str})
+            latencies.append(elapsed)
+            status[f"{method} {code}"] += 1
+
+
+def run_profile(profile, args, database_url):
+    # stesso profilo anche per il seed: journal_mode=WAL resta nel file
+    os.environ["DB_PROFILE"] = profile
+    emails, slots = seed_database(database_url, args.readers + args.writers)
+    day = next_weekday(3)
+    slots = [s for s in slots if s["giorno_settimana"] == 3]
+
+    port = free_port()
+    proc = start_server(database_url, port, args.server, args.workers,
+                        extra_env={"DB_PROFILE": profile, "AVAILABILITY_CACHE_SIZE": "0"})
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        tokens = []
+        for email in emails:
+            _, _, body, _ = request(base_url, "POST", "/api/auth/login", body={"email": email, "password": "bench"})
+            tokens.append(body["token"])
+
+        reads, writes = [], []
+        read_status, write_status = Counter(), Counter()
+        stop = threading.Event()
+        date_str = day.isoformat()
+        threads = [
+            threading.Thread(target=reader, args=(base_url, tokens[i], date_str, reads, read_status, stop))
+            for i in range(args.readers)
+        ] + [
+            threading.Thread(target=writer, args=(base_url, tokens[args.readers + i], slots, date_str, writes, write_status, stop))
+            for i in range(args.writers)
+        ]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        time.sleep(args.duration)
+        stop.set()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        stop_server(proc)
+
+    return {
+        "reads": {**latency_summary(reads), "rps": round(len(reads) / elapsed, 1), "status": dict(read_status)},
+        "writes": {**latency_summary(writes), "rps": round(len(writes) / elapsed, 1), "status": dict(write_status)},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Letture /api/slots durante scritture, per profilo DB")
+    parser.add_argument("--profiles", default="none,sqlite", help="lista di DB_PROFILE separati da virgola")
+    parser.add_argument("--readers", type=int, default=30)
+    parser.add_argument("--writers", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--database-url", default=None, help="default: un SQLite temporaneo nuovo per ogni profilo")
+    parser.add_argument("--server", choices=["werkzeug", "gunicorn"], default="werkzeug")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args(argv)
+
+    results = {"config": vars(args), "revision": git_revision(), "profiles": {}}
+    for profile in [p.strip() for p in args.profiles.split(",") if p.strip()]:
+        random.seed(args.seed)
+        database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='sport-bench-'), 'bench.db')}"
+        print(f"[RUN] {profile} on {database_url.split('@')[-1]}")
+        r = results["profiles"][profile] = run_profile(profile, args, database_url)
+        for kind in ("reads", "writes"):
+            x = r[kind]
+            print(f"  {kind:6s} {x['rps']:7.1f} req/s p50={x['p50_ms']}ms p95={x['p95_ms']}ms "
+                  f"p99={x['p99_ms']}ms status={x['status']}")
+
+    path = save_results("contention", results, args.out)
+    print(f"[OK] results: {path}")
+
+
+if __name__ == "__main__":
+    main()
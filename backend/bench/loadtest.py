@@ -0,0 +1,197 @@
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+from common import (
+    free_port, git_revision, latency_summary, next_weekday, request, save_results,
+    seed_database, start_server, stop_server,
+)
+
+# Simula l'apertura delle prenotazioni: N utenti sintetici, molti client
+# concorrenti con un mix di login / GET /api/slots / book / cancel contro un
+# server locale (SQLite temporaneo, oppure --database-url per Postgres).
+# Risultati (throughput, p50/p95/p99 per endpoint, SQL per richiesta,
+# overbooking) salvati in bench/results/*.json per confronti tra versioni.
+#
+#   python bench/loadtest.py --users 289 --clients 50 --duration 30
+#   python bench/loadtest.py --users 5000 --clients 200 --server gunicorn --workers 4
+#   python bench/loadtest.py --users 289 --clients 100 --mix book=8,cancel=2 --admission
+
+DEFAULT_MIX = "slots=6,book=3,cancel=1"
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+class Stats:
+    def __init__(self):
+        self.latency = defaultdict(list)
+        self.status = defaultdict(Counter)
+        self.sql = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, status, headers, elapsed):
+        with self.lock:
+            self.latency[endpoint].append(elapsed)
+            self.status[endpoint][status] += 1
+            n = headers.get("X-Bench-SQL") if headers else None
+            if n is not None:
+                self.sql[endpoint].append(int(n))
+
+
+def client(base_url, emails, slots, day, mix, stats, stop, password):
+    email = random.choice(emails)
+    status, headers, body, elapsed = request(base_url, "POST", "/api/auth/login",
+                                             body={"email": email, "password": password})
+    stats.record("login", status, headers, elapsed)
+    if status != 200:
+        return
+    token = body["token"]
+    mine = set()
+    names, weights = zip(*mix.items())
+    date_str = day.isoformat()
+
+    while not stop.is_set():
+        op = random.choices(names, weights)[0]
+        if op == "slots":
+            status, headers, _, elapsed = request(base_url, "GET", f"/api/slots?date={date_str}", token)
+        elif op == "book":
+            slot_id = random.choice(slots)["id"]
+            status, headers, body, elapsed = request(base_url, "POST", "/api/bookings", token,
+                                                     {"slot_id": slot_id, "date": date_str})
+            # coda di ammissione: 202 + ticket, si aspetta l'esito
+            while status == 202:
+                status, headers, body, wait = request(base_url, "GET", f"/api/bookings/tickets/{body['ticket']}?wait=5", token)
+                elapsed += wait
+            if status == 200:
+                mine.add(slot_id)
+        elif op == "cancel" and mine:
+            slot_id = mine.pop()
+            status, headers, _, elapsed = request(base_url, "DELETE", "/api/bookings", token,
+                                                  {"slot_id": slot_id, "date": date_str})
+        elif op == "login":
+            status, headers, _, elapsed = request(base_url, "POST", "/api/auth/login",
+                                                  body={"email": email, "password": password})
+        else:
+            continue
+        stats.record(op, status, headers, elapsed)
+
+
+def check_overbooking(database_url, day):
+    os.environ["DATABASE_URL"] = database_url
+    from sqlalchemy import func
+    from app import create_app, db
+    from app.models import Slot, Prenotazione, SlotOccupancy
+
+    app = create_app()
+    with app.app_context():
+        counts = dict(
+            db.session.query(Prenotazione.slot_id, func.count(Prenotazione.id))
+            .filter(Prenotazione.data == day).group_by(Prenotazione.slot_id)
+        )
+        counters = dict(
+            db.session.query(SlotOccupancy.slot_id, SlotOccupancy.prenotati).filter(SlotOccupancy.data == day)
+        )
+        violations, drift = [], []
+        for s in Slot.query.all():
+            n = counts.get(s.id, 0)
+            if s.capienza is not None and n > s.capienza:
+                violations.append({"slot_id": s.id, "capienza": s.capienza, "prenotati": n})
+            if s.id in counters and counters[s.id] != n:
+                drift.append({"slot_id": s.id, "contatore": counters[s.id], "prenotati": n})
+        db.engine.dispose()
+    return {"violations": violations, "counter_drift": drift, "bookings": sum(counts.values())}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test dell'API di prenotazione")
+    parser.add_argument("--users", type=int, default=289)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20.0, help="secondi di traffico dopo il login")
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--database-url", default=None, help="es. postgresql+psycopg2://... (default: SQLite temporaneo)")
+    parser.add_argument("--server", choices=["werkzeug", "gunicorn"], default="werkzeug")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--password-method", default="pbkdf2:sha256:1000",
+                        help="hash delle password seed (es. scrypt per misurare il costo reale del login)")
+    parser.add_argument("--admission", action="store_true", help="ADMISSION_MODE=queue sul server")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    tmpdir = None
+    database_url = args.database_url
+    if not database_url:
+        tmpdir = tempfile.mkdtemp(prefix="sport-bench-")
+        database_url = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+
+    day = next_weekday(3)  # mercoledì: PALESTRA cap 30, PISCINA cap 14, CAMPI illimitato
+    print(f"[SEED] {args.users} users on {database_url.split('@')[-1]}")
+    emails, slots = seed_database(database_url, args.users, password_method=args.password_method)
+    slots = [s for s in slots if s["giorno_settimana"] == 3]
+
+    port = free_port()
+    # stesso metodo del seed: niente rehash al login durante il test
+    extra_env = {"PASSWORD_METHOD": args.password_method}
+    if args.admission:
+        extra_env["ADMISSION_MODE"] = "queue"
+    proc = start_server(database_url, port, args.server, args.workers, extra_env=extra_env)
+    base_url = f"http://127.0.0.1:{port}"
+    stats = Stats()
+    stop = threading.Event()
+    try:
+        threads = [
+            threading.Thread(target=client, args=(base_url, emails, slots, day, parse_mix(args.mix), stats, stop, "bench"))
+            for _ in range(args.clients)
+        ]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        time.sleep(args.duration)
+        stop.set()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        stop_server(proc)
+
+    total = sum(len(v) for v in stats.latency.values())
+    results = {
+        "config": {**vars(args), "database": database_url.split("://")[0], "date": day.isoformat()},
+        "revision": git_revision(),
+        "elapsed_s": round(elapsed, 2),
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 1),
+        "endpoints": {
+            name: {
+                **latency_summary(values),
+                "status": dict(stats.status[name]),
+                "sql_per_request": round(sum(stats.sql[name]) / len(stats.sql[name]), 2) if stats.sql[name] else None,
+            }
+            for name, values in stats.latency.items()
+        },
+        "overbooking": check_overbooking(database_url, day),
+    }
+    path = save_results("loadtest", results, args.out)
+
+    print(f"[OK] {total} requests in {elapsed:.1f}s = {results['throughput_rps']} req/s")
+    for name, ep in results["endpoints"].items():
+        print(f"  {name:7s} n={ep['count']:6d} p50={ep['p50_ms']}ms p95={ep['p95_ms']}ms p99={ep['p99_ms']}ms "
+              f"sql/req={ep['sql_per_request']} status={ep['status']}")
+    ob = results["overbooking"]
+    print(f"  overbooking violations: {len(ob['violations'])}, counter drift: {len(ob['counter_drift'])}, bookings: {ob['bookings']}")
+    print(f"[OK] results: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from werkzeug.serving import make_server
+
+from app import create_app, db
+
+# App usata dai benchmark: con BENCH_SQL_HEADER=1 ogni risposta riporta in
+# X-Bench-SQL il numero di statement SQL eseguiti per quella richiesta.
+
+app = create_app()
+
+if os.getenv("BENCH_SQL_HEADER") == "1":
+    _local = threading.local()
+
+    with app.app_context():
+        @event.listens_for(db.engine, "before_cursor_execute")
+        def _count(*args):
+            _local.n = getattr(_local, "n", 0) + 1
+
+    @app.before_request
+    def _reset():
+        _local.n = 0
+
+    @app.after_request
+    def _header(resp):
+        resp.headers["X-Bench-SQL"] = str(getattr(_local, "n", 0))
+        return resp
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5001
+    make_server("127.0.0.1", port, app, threaded=True).serve_forever()
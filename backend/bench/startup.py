@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import (
+    BACKEND_DIR, free_port, git_revision, next_weekday, save_results, seed_database, start_server, stop_server,
+)
+
+# Avvio a freddo: per ogni giro un processo Python nuovo importa run.py (che
+# crea l'app) e serve la prima richiesta autenticata (GET /api/slots) col test
+# client, poi una seconda a caldo; con --server anche il tempo dal lancio del
+# server alla prima risposta di /api/health. Per il confronto prima/dopo si
+# lancia su entrambe le revisioni: i risultati riportano la revisione git.
+#
+#   python bench/startup.py --runs 10
+#   python bench/startup.py --runs 5 --server gunicorn --workers 2
+
+PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import run
+t1 = time.perf_counter()
+import jwt
+token = jwt.encode({"sub": "1", "ruolo": "ADMIN"}, run.app.config["JWT_SECRET"], algorithm="HS256")
+client = run.app.test_client()
+headers = {"Authorization": f"Bearer {token}"}
+t2 = time.perf_counter()
+first = client.get("/api/slots?date=" + sys.argv[1], headers=headers)
+t3 = time.perf_counter()
+client.get("/api/slots?date=" + sys.argv[1], headers=headers)
+t4 = time.perf_counter()
+print(json.dumps({"status": first.status_code, "import_ms": (t1 - t0) * 1000,
+                  "first_request_ms": (t3 - t2) * 1000, "warm_request_ms": (t4 - t3) * 1000,
+                  "modules": len(sys.modules)}))
+"""
+
+
+def probe(env, date_str):
+    started = time.perf_counter()
+    out = subprocess.check_output([sys.executable, "-c", PROBE, date_str], cwd=BACKEND_DIR, env=env, text=True)
+    result = json.loads(out.strip().splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def summary(values):
+    return {"median": round(statistics.median(values), 1), "min": round(min(values), 1), "max": round(max(values), 1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import, creazione app e prima richiesta a processo nuovo")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--database-url", default=None, help="default: un SQLite temporaneo nuovo")
+    parser.add_argument("--server", choices=["none", "werkzeug", "gunicorn"], default="none",
+                        help="misura anche il tempo dal lancio del server alla prima risposta")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args(argv)
+
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='sport-bench-'), 'bench.db')}"
+    seed_database(database_url, 2)
+    env = dict(os.environ, DATABASE_URL=database_url)
+    date_str = next_weekday(2).isoformat()
+
+    runs = []
+    for _ in range(args.runs):
+        r = probe(env, date_str)
+        if r["status"] != 200:
+            raise RuntimeError(f"first request failed: {r}")
+        runs.append(r)
+
+    results = {"config": vars(args), "revision": git_revision(), "modules": runs[-1]["modules"]}
+    for key in ("import_ms", "first_request_ms", "warm_request_ms", "process_ms"):
+        results[key] = summary([r[key] for r in runs])
+
+    if args.server != "none":
+        ready = []
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            proc = start_server(database_url, free_port(), args.server, args.workers)
+            ready.append((time.perf_counter() - started) * 1000)
+            stop_server(proc)
+        results["server_ready_ms"] = summary(ready)
+
+    for key in ("import_ms", "first_request_ms", "warm_request_ms", "process_ms", "server_ready_ms"):
+        if key in results:
+            x = results[key]
+            print(f"  {key:18s} median={x['median']}ms min={x['min']}ms max={x['max']}ms")
+    print(f"  modules loaded     {results['modules']}")
+
+    path = save_results("startup", results, args.out)
+    print(f"[OK] results: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import argparse
+from datetime import date
+from dotenv import load_dotenv
+from sqlalchemy import func, select
+
+load_dotenv()
+
+from app import create_app, db
+from app.booking import _reserve_stmt
+from app.exports import bookings_query
+from app.models import User, Slot, Prenotazione
+
+# Stampa il piano di esecuzione delle query degli endpoint caldi, per
+# verificare che usino gli indici (app.models / app.migrations).
+
+def endpoint_queries(d, slot_id, user_id, email):
+    return [
+        ("POST /auth/login", select(User).where(func.lower(User.email) == email)),
+        ("GET /slots: conteggi", select(Prenotazione.slot_id, func.count(Prenotazione.id))
+            .where(Prenotazione.data == d).group_by(Prenotazione.slot_id)),
+        ("GET /slots: prenotati da me", select(Prenotazione.slot_id)
+            .where(Prenotazione.data == d, Prenotazione.user_id == user_id)),
+        ("GET /slots/range: conteggi", select(Prenotazione.slot_id, Prenotazione.data, func.count(Prenotazione.id))
+            .where(Prenotazione.data >= d, Prenotazione.data <= d.replace(day=28))
+            .group_by(Prenotazione.slot_id, Prenotazione.data)),
+        ("GET /bookings/mine", select(Prenotazione.id, Slot.ora_inizio).join(Slot, Slot.id == Prenotazione.slot_id)
+            .where(Prenotazione.user_id == user_id, Prenotazione.data >= d)
+            .order_by(Prenotazione.data, Slot.ora_inizio, Prenotazione.id).limit(51)),
+        ("POST /bookings: riserva posto", _reserve_stmt(slot_id, d, 30)),
+        ("GET /admin/bookings", select(Prenotazione, User).join(User, User.id == Prenotazione.user_id)
+            .where(Prenotazione.slot_id == slot_id, Prenotazione.data == d)
+            .order_by(User.cognome, User.nome)),
+        ("GET /admin/export/range", bookings_query(d, d.replace(day=28)).statement),
+    ]
+
+def explain(stmt):
+    dialect = db.engine.dialect
+    sql = str(stmt.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+    prefix = "EXPLAIN QUERY PLAN " if dialect.name == "sqlite" else "EXPLAIN "
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql(prefix + sql).all()
+    if dialect.name == "sqlite":
+        return [r[-1] for r in rows]
+    return [r[0] for r in rows]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Piani di esecuzione delle query degli endpoint")
+    parser.add_argument("--date", default=date.today().isoformat())
+    parser.add_argument("--slot-id", type=int, default=1)
+    parser.add_argument("--user-id", type=int, default=1)
+    parser.add_argument("--email", default="massimo.meneghelli@smam.local")
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    with app.app_context():
+        d = date.fromisoformat(args.date)
+        for name, stmt in endpoint_queries(d, args.slot_id, args.user_id, args.email):
+            print(f"== {name}")
+            for line in explain(stmt):
+                print(f"   {line}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import os
+
+# Letto da gunicorn all'avvio dalla cartella backend: `gunicorn run:app`.
+# Con preload_app il master importa e crea l'app una volta sola, i worker
+# nascono col fork e condividono quella memoria (copy-on-write): niente import
+# ripetuti per worker, avvio più rapido sui riavvii a freddo dell'hosting.
+# Le opzioni da riga di comando (-w, -k, -b, app) hanno la precedenza.
+
+wsgi_app = "run:app"
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "gthread"
+# ogni stream SSE aperto tiene un thread: gli stream per worker sono al massimo
+# threads - SSE_SPARE_THREADS (post_worker_init), il resto serve le richieste
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+
+def post_fork(server, worker):
+    # senza preload l'app viene creata dopo il fork, nel worker: niente da fare
+    if not server.cfg.preload_app:
+        return
+    from app import after_fork
+    after_fork(worker.app.wsgi())
+
+
+def post_worker_init(worker):
+    # dopo il caricamento dell'app, con o senza preload; l'app ASGI ha il suo pool
+    app = worker.app.wsgi()
+    if hasattr(app, "flask_app"):
+        return
+    from app.events import publisher
+    publisher.fit_threads(worker.cfg.threads, app.config["SSE_SPARE_THREADS"])
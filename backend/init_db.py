@@ -1,12 +1,16 @@
 import os
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
-from werkzeug.security import generate_password_hash
+from sqlalchemy import insert, inspect, update
 from openpyxl import load_workbook
 
 load_dotenv()
 
-from app import create_app, db
+from app import create_app, db, migrations
 from app.models import User, Slot
+from app.security import password_hasher, hash_password
 
 DEFAULT_PASSWORD = os.getenv("DEFAULT_PASSWORD", "ChangeMe123!")
 
@@ -22,15 +26,18 @@ def detect_columns(headers):
     # ritorna indici colonna per nome/cognome/gruppo
     h = [str(x).strip().lower() if x is not None else "" for x in headers]
 
-    def find_any(cands):
+    def find_any(cands, skip=None):
         for idx, val in enumerate(h):
+            if idx == skip:
+                continue
             for c in cands:
                 if c in val:
                     return idx
         return None
 
-    col_nome = find_any(["nome"])
     col_cognome = find_any(["cognome"])
+    # "nome" è contenuto anche in "cognome"
+    col_nome = find_any(["nome"], skip=col_cognome)
     # gruppo può chiamarsi anche plotone/classe ecc.
     col_gruppo = find_any(["gruppo", "plotone", "classe"])
     return col_nome, col_cognome, col_gruppo
@@ -39,28 +46,63 @@ def load_users_from_excel(path):
     if not os.path.exists(path):
         raise FileNotFoundError(f"Excel not found: {path}")
 
-    wb = load_workbook(path)
-    ws = wb.active
+    # read_only: le righe vengono lette in streaming, senza caricare il foglio in memoria
+    wb = load_workbook(path, read_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        headers = next(rows, ())
+        col_nome, col_cognome, col_gruppo = detect_columns(headers)
 
-    headers = [cell.value for cell in ws[1]]
-    col_nome, col_cognome, col_gruppo = detect_columns(headers)
+        if col_nome is None or col_cognome is None:
+            raise ValueError("Nel file Excel non trovo le colonne 'Nome' e/o 'Cognome' nella prima riga.")
 
-    if col_nome is None or col_cognome is None:
-        raise ValueError("Nel file Excel non trovo le colonne 'Nome' e/o 'Cognome' nella prima riga.")
+        def cell(row, idx):
+            if idx is None or idx >= len(row) or not row[idx]:
+                return ""
+            return str(row[idx]).strip()
 
-    users = []
-    for row in ws.iter_rows(min_row=2, values_only=True):
-        nome = str(row[col_nome]).strip() if row[col_nome] else ""
-        cognome = str(row[col_cognome]).strip() if row[col_cognome] else ""
-        gruppo = str(row[col_gruppo]).strip() if (col_gruppo is not None and row[col_gruppo]) else ""
+        users = []
+        for row in rows:
+            nome = cell(row, col_nome)
+            cognome = cell(row, col_cognome)
+            gruppo = cell(row, col_gruppo)
 
-        if not nome or not cognome:
-            continue
+            if not nome or not cognome:
+                continue
 
-        users.append((nome, cognome, gruppo))
+            users.append((nome, cognome, gruppo))
+    finally:
+        wb.close()
 
     return users
 
+def diff_users(rows, existing):
+    # rows: (nome, cognome, gruppo) dall'Excel; existing: email -> (id, nome, cognome, gruppo)
+    added, updated, unchanged = {}, {}, []
+    for nome, cognome, gruppo in rows:
+        email = slug_email(nome, cognome)
+        current = existing.get(email)
+        if current is None:
+            added[email] = {"nome": nome, "cognome": cognome, "gruppo": gruppo, "ruolo": "USER", "email": email}
+        elif current[1:] != (nome, cognome, gruppo):
+            # aggiorno campi base senza toccare password
+            updated[email] = {"id": current[0], "nome": nome, "cognome": cognome, "gruppo": gruppo}
+        else:
+            unchanged.append(email)
+    return list(added.values()), list(updated.values()), unchanged
+
+def hash_default_passwords(n, workers=None):
+    # hash tutti diversi (salt casuale): calcolati in parallelo su più processi
+    if n == 0:
+        return []
+    method = password_hasher.method
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(hash_password, [DEFAULT_PASSWORD] * n, [method] * n, chunksize=max(n // 32, 1)))
+
+def in_batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
 def seed_slots():
     # PALESTRA Lun–Ven: 1)16:00-17:15 2)17:15-18:15 3)20:00-21:15 cap 30
     for dow in [1,2,3,4,5]:
@@ -109,7 +151,7 @@ def ensure_single_admin():
             gruppo=admin_gruppo,
             ruolo="ADMIN",
             email=admin_email,
-            password_hash=generate_password_hash(DEFAULT_PASSWORD),
+            password_hash=password_hasher.hash(DEFAULT_PASSWORD),
         )
         db.session.add(admin)
     else:
@@ -120,48 +162,76 @@ def ensure_single_admin():
         # non tocchiamo password se già esiste
     db.session.flush()
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Crea il DB e importa utenti/slot")
+    parser.add_argument("--dry-run", action="store_true", help="mostra aggiunti/aggiornati/invariati senza scrivere")
+    parser.add_argument("--excel", default=EXCEL_PATH)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=None, help="processi per l'hashing delle password")
+    args = parser.parse_args(argv)
+
+    timings = {}
+
+    def stage(name, started):
+        timings[name] = time.perf_counter() - started
+
     app = create_app()
     with app.app_context():
-        db.create_all()
+        if not args.dry_run:
+            db.create_all()
+            migrations.upgrade()
 
-        # Seed slots solo se non esistono
-        if Slot.query.count() == 0:
-            seed_slots()
+            # Seed slots solo se non esistono
+            if Slot.query.count() == 0:
+                seed_slots()
 
-        # Import utenti Excel (aggiunge solo quelli mancanti)
-        imported = 0
+        # Import utenti Excel (aggiunge i mancanti, aggiorna nome/cognome/gruppo)
+        t = time.perf_counter()
         try:
-            rows = load_users_from_excel(EXCEL_PATH)
+            rows = load_users_from_excel(args.excel)
         except Exception as e:
             print(f"[WARN] Impossibile importare utenti da Excel: {e}")
             rows = []
-
-        for nome, cognome, gruppo in rows:
-            email = slug_email(nome, cognome)
-            exists = User.query.filter_by(email=email).first()
-            if exists:
-                # aggiorno campi base senza toccare password
-                exists.nome = nome
-                exists.cognome = cognome
-                exists.gruppo = gruppo
-                continue
-
-            u = User(
-                nome=nome,
-                cognome=cognome,
-                gruppo=gruppo,
-                ruolo="USER",
-                email=email,
-                password_hash=generate_password_hash(DEFAULT_PASSWORD),
-            )
-            db.session.add(u)
-            imported += 1
-
-        ensure_single_admin()
-
-        db.session.commit()
-        print(f"[OK] DB ready. Imported new users: {imported}. Slots: {Slot.query.count()}, Users: {User.query.count()}")
+        stage("read", t)
+
+        t = time.perf_counter()
+        existing = {}
+        if inspect(db.engine).has_table(User.__tablename__):
+            existing = {
+                email: (uid, nome, cognome, gruppo)
+                for uid, email, nome, cognome, gruppo in db.session.query(
+                    User.id, User.email, User.nome, User.cognome, User.gruppo
+                )
+            }
+        added, updated, unchanged = diff_users(rows, existing)
+        stage("prefetch", t)
+
+        if args.dry_run:
+            for u in added:
+                print(f"  + {u['email']} ({u['gruppo']})")
+            for u in updated:
+                print(f"  ~ {u['nome']} {u['cognome']} ({u['gruppo']})")
+            print(f"[DRY-RUN] added: {len(added)}, updated: {len(updated)}, unchanged: {len(unchanged)}")
+        else:
+            t = time.perf_counter()
+            for u, h in zip(added, hash_default_passwords(len(added), args.workers)):
+                u["password_hash"] = h
+            stage("hash", t)
+
+            t = time.perf_counter()
+            for batch in in_batches(added, args.batch_size):
+                db.session.execute(insert(User), batch)
+            for batch in in_batches(updated, args.batch_size):
+                db.session.execute(update(User), batch)
+
+            ensure_single_admin()
+
+            db.session.commit()
+            stage("write", t)
+            print(f"[OK] DB ready. Imported new users: {len(added)}, updated: {len(updated)}, unchanged: {len(unchanged)}. "
+                  f"Slots: {Slot.query.count()}, Users: {User.query.count()}")
+
+        print("[TIME] " + " | ".join(f"{name} {secs:.2f}s" for name, secs in timings.items()))
 
 if __name__ == "__main__":
     main()
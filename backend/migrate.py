@@ -0,0 +1,29 @@
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from app import create_app, db
+from app import migrations
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aggiorna lo schema del DB esistente")
+    parser.add_argument("--status", action="store_true", help="mostra versione e migrazioni mancanti")
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    with app.app_context():
+        if args.status:
+            print(f"[OK] Schema version: {migrations.current_version()}")
+            for v, desc in migrations.pending():
+                print(f"  pending {v}: {desc}")
+            return
+
+        db.create_all()  # tabelle nuove
+        applied = migrations.upgrade()
+        for v, desc in applied:
+            print(f"  applied {v}: {desc}")
+        print(f"[OK] Schema version: {migrations.current_version()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def next_weekday(dow, weeks=1):
+    # data futura con giorno_settimana dow (1 = lunedì)
+    today = date.today()
+    return today + timedelta(days=(dow - today.isoweekday()) % 7 + 7 * weeks)
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # DB SQLite nuovo per ogni test (backend/.env punta a PostgreSQL)
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv("JWT_SECRET", "test-secret-" + "x" * 32)
+    monkeypatch.setenv("PASSWORD_METHOD", "pbkdf2:sha256:1000")
+    from app import create_app, db, migrations
+    from app.auth import user_cache
+    from app.availability import availability_cache
+    from app.schedule import schedule
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        migrations.upgrade()
+        # cache di processo: niente residui del DB di un test precedente
+        schedule.invalidate()
+        availability_cache.clear()
+        user_cache.clear()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    from werkzeug.security import generate_password_hash
+
+    from app import db
+    from app.models import User
+
+    def make(email, ruolo="USER"):
+        user = User(nome="Nome", cognome=email.split("@")[0], gruppo="G", ruolo=ruolo, email=email,
+                    password_hash=generate_password_hash("pw", method="pbkdf2:sha256:1000"))
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def make_slot(app):
+    from app import db
+    from app.models import Slot
+    from app.schedule import schedule
+
+    def make(capienza=30, giorno_settimana=2, impianto="PALESTRA", ora_inizio="16:00", ora_fine="17:15"):
+        slot = Slot(impianto=impianto, titolo=impianto.title(), giorno_settimana=giorno_settimana,
+                    ora_inizio=ora_inizio, ora_fine=ora_fine, capienza=capienza, attivo=True)
+        db.session.add(slot)
+        db.session.commit()
+        schedule.rebuild()
+        return slot
+    return make
+
+
+@pytest.fixture
+def login(client):
+    # header Authorization per l'utente
+    def do(email):
+        resp = client.post("/api/auth/login", json={"email": email, "password": "pw"})
+        assert resp.status_code == 200, resp.get_json()
+        return {"Authorization": f"Bearer {resp.get_json()['token']}"}
+    return do
+
+
+@pytest.fixture
+def asgi_app(app):
+    # modalità ASGI sulla stessa app Flask (stesso DB di test)
+    import asyncio
+
+    from app.asgi import AsyncApi
+
+    api = AsyncApi(app)
+    yield api
+    asyncio.run(api.engine.dispose())
+    api.fallback.executor.shutdown()
+
+
+async def asgi_request(api, method, path, headers=None, body=None):
+    # una richiesta HTTP all'app ASGI senza server: (status, header, corpo)
+    path, _, query = path.partition("?")
+    headers = dict(headers or {})
+    if body:
+        headers["content-length"] = str(len(body))
+    scope = {
+        "type": "http", "http_version": "1.1", "method": method, "scheme": "http",
+        "path": path, "raw_path": path.encode(), "root_path": "", "query_string": query.encode(),
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+    }
+    messages = [{"type": "http.request", "body": body or b"", "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await api(scope, receive, send)
+    start = sent[0]
+    response_headers = {k.decode(): v.decode() for k, v in start["headers"]}
+    return start["status"], response_headers, b"".join(m.get("body", b"") for m in sent[1:])
@@ -0,0 +1,28 @@
+from datetime import date, timedelta
+
+from sqlalchemy import select
+
+from app import db
+from app.archive import archive_before, bookings_source
+from app.booking import book_series
+from app.models import Prenotazione, PrenotazioneArchivio, Slot, User
+
+
+def test_archive_keeps_series_id(app):
+    user = User(nome="Anna", cognome="Rossi", gruppo="G", ruolo="USER", email="anna@test", password_hash="x")
+    slot = Slot(impianto="PALESTRA", titolo="Palestra", giorno_settimana=2,
+                ora_inizio="16:00", ora_fine="17:15", capienza=30, attivo=True)
+    db.session.add_all([user, slot])
+    db.session.commit()
+
+    d_from = date(2026, 10, 20)  # martedì
+    serie, booked, full, _ = book_series(user.id, slot, d_from, d_from + timedelta(weeks=2))
+    assert serie is not None and len(booked) == 3 and not full
+
+    assert archive_before(d_from + timedelta(weeks=3)) == 3
+    assert db.session.scalar(select(Prenotazione.id)) is None
+    archived = db.session.scalars(select(PrenotazioneArchivio)).all()
+    assert {a.serie_id for a in archived} == {serie.id}
+
+    src = bookings_source(d_from)
+    assert set(db.session.scalars(select(src.c.serie_id))) == {serie.id}
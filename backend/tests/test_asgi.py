@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+from app.events import publisher
+from conftest import asgi_request, next_weekday
+
+
+def test_fallback_serves_flask_routes(asgi_app, make_user, make_slot):
+    make_user("a@test")
+    slot = make_slot()
+    d = next_weekday(slot.giorno_settimana)
+
+    async def scenario():
+        # login e prenotazione non hanno una route async: passano dall'app Flask
+        status, headers, body = await asgi_request(asgi_app, "POST", "/api/auth/login",
+                                                   {"content-type": "application/json"},
+                                                   json.dumps({"email": "a@test", "password": "pw"}).encode())
+        assert status == 200 and headers["content-type"] == "application/json"
+        auth = {"authorization": f"Bearer {json.loads(body)['token']}", "content-type": "application/json"}
+
+        status, _, body = await asgi_request(asgi_app, "POST", "/api/bookings", auth,
+                                             json.dumps({"slot_id": slot.id, "date": d.isoformat()}).encode())
+        assert status == 200 and json.loads(body) == {"ok": True}
+
+        status, _, body = await asgi_request(asgi_app, "GET", f"/api/slots?date={d.isoformat()}", auth)
+        assert json.loads(body)["slots"][0]["prenotati"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_fallback_login_while_stream_is_open(asgi_app, make_user, make_slot, login, monkeypatch):
+    monkeypatch.setattr(publisher, "heartbeat", 0.05)
+    make_user("a@test")
+    slot = make_slot()
+    d = next_weekday(slot.giorno_settimana)
+    token = login("a@test")["Authorization"].split()[1]
+
+    async def scenario():
+        gone = asyncio.Event()
+
+        async def receive():
+            await gone.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if gone.is_set():
+                raise OSError("client disconnected")
+
+        scope = {
+            "type": "http", "http_version": "1.1", "method": "GET", "scheme": "http",
+            "path": "/api/slots/stream", "raw_path": b"/api/slots/stream", "root_path": "",
+            "query_string": f"date={d.isoformat()}&access_token={token}".encode(), "headers": [],
+            "client": ("127.0.0.1", 50001), "server": ("testserver", 80),
+        }
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+        async def first_receive():
+            return messages.pop(0) if messages else await receive()
+
+        stream = asyncio.create_task(asgi_app(scope, first_receive, send))
+        while not publisher.has_subscribers(d):
+            await asyncio.sleep(0.01)
+
+        # con lo stream aperto il login (altra richiesta WSGI) non resta in coda
+        status, _, _ = await asyncio.wait_for(
+            asgi_request(asgi_app, "POST", "/api/auth/login", {"content-type": "application/json"},
+                         json.dumps({"email": "a@test", "password": "pw"}).encode()),
+            timeout=5,
+        )
+        assert status == 200
+
+        # client andato: al primo heartbeat l'invio fallisce e lo stream viene chiuso
+        gone.set()
+        try:
+            await asyncio.wait_for(stream, timeout=5)
+        except OSError:
+            pass
+        assert not publisher.has_subscribers(d)
+
+    asyncio.run(scenario())
@@ -0,0 +1,23 @@
+from conftest import next_weekday
+
+
+def test_non_object_operations_are_invalid_items(client, make_user, make_slot, login):
+    make_user("a@test")
+    slot = make_slot()
+    d = next_weekday(slot.giorno_settimana)
+    headers = login("a@test")
+
+    resp = client.post("/api/bookings/batch", headers=headers, json={"mode": "best_effort", "operations": [
+        "x", 7, {"slot_id": slot.id, "date": d.isoformat()},
+    ]})
+    assert resp.status_code == 200
+    results = resp.get_json()["results"]
+    assert [(r["ok"], r.get("error")) for r in results] == [
+        (False, "Invalid operation"), (False, "Invalid operation"), (True, None),
+    ]
+
+    resp = client.post("/api/bookings/batch", headers=headers, json={"operations": ["x"]})
+    assert resp.status_code == 409
+    assert resp.get_json()["results"][0]["error"] == "Invalid operation"
+
+    assert client.post("/api/bookings/batch", headers=headers, json=["x"]).status_code == 400
@@ -0,0 +1,55 @@
+from app.events import RESET, publisher
+from app.routes import notify_streams
+from conftest import next_weekday
+
+
+def first_events(stream):
+    # primo blocco che non è un heartbeat (al più ~2 s con heartbeat di 0.05 s)
+    for _, events in zip(range(40), stream):
+        if events:
+            return events
+    return None
+
+
+def test_reconnect_replays_change_made_while_disconnected(client, make_user, make_slot, login, monkeypatch):
+    monkeypatch.setattr(publisher, "heartbeat", 0.05)
+    slot = make_slot()
+    d = next_weekday(slot.giorno_settimana)
+    booking = {"slot_id": slot.id, "date": d.isoformat()}
+    for email in ("a@test", "b@test"):
+        make_user(email)
+
+    assert publisher.open_stream(d)
+    stream = publisher.subscribe(d)
+    assert next(stream) == []  # iscritto dall'ultimo evento attuale
+    assert client.post("/api/bookings", json=booking, headers=login("a@test")).status_code == 200
+    [(n, payload)] = first_events(stream)
+    assert payload["prenotati"] == 1
+    stream.close()
+    publisher.close_stream(d)
+
+    # nessuno stream aperto per la data mentre cambia
+    assert client.post("/api/bookings", json=booking, headers=login("b@test")).status_code == 200
+
+    assert publisher.open_stream(d)
+    try:
+        events = first_events(publisher.subscribe(d, publisher.event_id(n)))
+    finally:
+        publisher.close_stream(d)
+    assert events is not RESET
+    assert [p["prenotati"] for _, p in events] == [2]
+
+
+def test_reconnect_gets_reset_when_count_unknown(app, make_slot, monkeypatch):
+    monkeypatch.setattr(publisher, "heartbeat", 0.05)
+    slot = make_slot()
+    d = next_weekday(slot.giorno_settimana)
+    last_id = publisher.event_id(publisher._last)
+
+    notify_streams(d, slot.id, None)
+
+    assert publisher.open_stream(d)
+    try:
+        assert first_events(publisher.subscribe(d, last_id)) is RESET
+    finally:
+        publisher.close_stream(d)
@@ -0,0 +1,29 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from conftest import next_weekday
+
+
+def test_failed_statements_leave_nothing_on_the_connection(app):
+    for _ in range(3):
+        with pytest.raises(OperationalError):
+            db.session.execute(text("SELECT * FROM missing_table"))
+        db.session.rollback()
+
+    info = db.session.connection().connection.info  # connessione DBAPI del pool
+    assert not info.get("metrics_start")
+
+
+def test_booking_counts_rows_affected(client, make_user, make_slot, login):
+    make_user("admin@test", ruolo="ADMIN")
+    make_user("a@test")
+    slot = make_slot()
+    d = next_weekday(slot.giorno_settimana)
+    assert client.post("/api/bookings", json={"slot_id": slot.id, "date": d.isoformat()},
+                       headers=login("a@test")).status_code == 200
+
+    text_out = client.get("/api/metrics", headers=login("admin@test")).get_data(as_text=True)
+    [line] = [l for l in text_out.splitlines() if l.startswith('sport_sql_rows_affected_total{endpoint="api.book"}')]
+    assert int(line.split()[-1]) >= 2  # contatore + prenotazione
@@ -0,0 +1,46 @@
+import asyncio
+import json
+
+from app import booking
+from conftest import asgi_request, next_weekday
+
+
+def test_slots_304_does_not_hide_booking_made_on_another_worker(client, make_user, make_slot, login):
+    user = make_user("a@test")
+    slot = make_slot()
+    d = next_weekday(slot.giorno_settimana)
+    headers = login("a@test")
+    url = f"/api/slots?date={d.isoformat()}"
+
+    first = client.get(url, headers=headers)
+    etag = first.headers["ETag"]
+    assert client.get(url, headers={**headers, "If-None-Match": etag}).status_code == 304
+
+    # prenotazione scritta da un altro processo: la cache di questo non lo sa
+    booking.book(user.id, slot, d)
+
+    resp = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert resp.status_code == 200
+    [s] = resp.get_json()["slots"]
+    assert s["prenotato_da_me"] is True
+
+
+def test_asgi_slots_304_does_not_hide_booking(asgi_app, make_user, make_slot, login):
+    user = make_user("a@test")
+    slot = make_slot()
+    d = next_weekday(slot.giorno_settimana)
+    headers = login("a@test")
+    url = f"/api/slots?date={d.isoformat()}"
+
+    async def scenario():
+        _, first, _ = await asgi_request(asgi_app, "GET", url, headers)
+        status, _, _ = await asgi_request(asgi_app, "GET", url, {**headers, "If-None-Match": first["etag"]})
+        assert status == 304
+
+        booking.book(user.id, slot, d)
+
+        status, _, body = await asgi_request(asgi_app, "GET", url, {**headers, "If-None-Match": first["etag"]})
+        assert status == 200
+        assert json.loads(body)["slots"][0]["prenotato_da_me"] is True
+
+    asyncio.run(scenario())